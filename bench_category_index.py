@@ -0,0 +1,89 @@
+"""
+Замер индекса категорий для быстрого ввода /e.
+
+Для пользователей с разным числом категорий строит CategoryIndex,
+измеряет время построения, занимаемую индексом память и время поиска
+по точному названию, по началу названия и с опечатками.
+
+Примеры:
+    python bench_category_index.py
+    python bench_category_index.py --sizes 5 1000 5000 --queries 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import CategoryIndex
+
+# Буквы, из которых составляются названия категорий
+LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+# Строка таблицы результатов
+ROW = "{:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}"
+
+
+# Случайное название из одного-трех слов
+def random_name(rng):
+    words = [''.join(rng.choice(LETTERS) for _ in range(rng.randint(3, 9))) for _ in range(rng.randint(1, 3))]
+    return ' '.join(words).capitalize()
+
+
+# Название с count случайными заменами букв
+def with_typos(name, count, rng):
+    chars = list(name.lower())
+    for position in rng.sample(range(len(chars)), min(count, len(chars))):
+        chars[position] = rng.choice(LETTERS)
+    return ''.join(chars)
+
+
+# Среднее время одного поиска в микросекундах
+def match_time(index, queries):
+    started = time.perf_counter()
+    for query in queries:
+        index.match(query)
+    return (time.perf_counter() - started) / len(queries) * 1e6
+
+
+def bench(size, query_count, rng):
+    names = list({random_name(rng) for _ in range(size * 2)})[:size]
+    categories = list(enumerate(names, 1))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = CategoryIndex(categories)
+    build = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    picked = [rng.choice(names) for _ in range(query_count)]
+    exact = match_time(index, picked)
+    prefix = match_time(index, [name[:3] for name in picked])
+    one_typo = match_time(index, [with_typos(name, 1, rng) for name in picked])
+    two_typos = match_time(index, [with_typos(name, 2, rng) for name in picked])
+
+    print(ROW.format(size, f"{build * 1000:.1f}", f"{memory / 1024:.0f}",
+                     f"{exact:.1f}", f"{prefix:.1f}", f"{one_typo:.1f}", f"{two_typos:.1f}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 1000], help="сколько категорий у пользователя")
+    parser.add_argument('--queries', type=int, default=1000, help="сколько запросов каждого вида")
+    parser.add_argument('--seed', type=int, default=26)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("Построение в мс, память в КБ, поиск в мкс на запрос")
+    print(ROW.format("категорий", "построение", "память", "точно", "начало", "1 опечатка", "2 опечатки"))
+    for size in args.sizes:
+        bench(size, args.queries, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Замер памяти, которую занимают состояния диалогов.
+
+Для каждого сценария запускается отдельный процесс, который создает
+состояния для заданного числа пользователей и сообщает resident set size
+(VmRSS из /proc/self/status) до и после. Отдельный процесс нужен потому,
+что освобожденная память не всегда возвращается системе и исказила бы
+следующий замер.
+
+Сценарии:
+    user_data  словари context.user_data со строками, которые старые
+               обработчики оставляли навсегда
+    flows      FlowState в flow_states, все пользователи посреди диалога
+    swept      то же после того, как sweep_flows удалил устаревшие состояния
+
+Примеры:
+    python bench_flows.py
+    python bench_flows.py --users 100000 --scenarios flows swept
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Сценарии в порядке вывода
+SCENARIOS = ('user_data', 'flows', 'swept')
+
+
+# Текущий resident set size процесса в байтах
+def resident_size():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmRSS недоступен: замер работает только в Linux")
+
+
+# Заполнить состояния для users пользователей по сценарию
+def fill(scenario, users):
+    import main
+
+    if scenario == 'user_data':
+        # Как в application.user_data: словарь на пользователя с ключами старых обработчиков
+        user_data = {}
+        for user_id in range(users):
+            user_data[user_id] = {
+                'user_id': user_id,
+                'edit_category_id': str(user_id % 1000),
+                'edit_category_name': f'Категория {user_id % 1000}',
+                'expense_category_id': str(user_id % 997),
+                'expense_category_name': f'Категория {user_id % 997}',
+            }
+        return user_data, len(user_data)
+
+    for user_id in range(users):
+        main.start_flow(user_id, 'add_expense', user_id % 1000, f'Категория {user_id % 1000}')
+
+    if scenario == 'swept':
+        for state in main.flow_states.values():
+            state.expires_at = 0
+        main.sweep_flows()
+    return main.flow_states, len(main.flow_states)
+
+
+# Замер одного сценария внутри дочернего процесса
+def run_scenario(scenario, users):
+    import main  # noqa: F401  импорт модуля входит в исходный размер
+
+    before = resident_size()
+    _, states = fill(scenario, users)
+    after = resident_size()
+    print(before, after, states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000000, help="сколько пользователей моделировать")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scenario(args.child, args.users)
+        return
+
+    print(f"Пользователей: {args.users}, RSS в МБ")
+    print(f"{'сценарий':>10} {'до':>8} {'после':>8} {'прирост':>8} {'Б/польз.':>9} {'состояний':>10}")
+    for scenario in args.scenarios:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', scenario, '--users', str(args.users)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        before, after, states = (int(value) for value in output.split()[-3:])
+        grown = after - before
+        print(f"{scenario:>10} {before / 2 ** 20:8.1f} {after / 2 ** 20:8.1f} {grown / 2 ** 20:8.1f} "
+              f"{grown / args.users:9.0f} {states:10d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Замер скорости работы с денежными суммами.
+
+Сравнивает прежнее форматирование сумм с плавающей точкой с пакетным
+format_money_many, измеряет parse_money и перенос таблицы расходов
+с REAL на целые копейки через migrate_money.
+
+Примеры:
+    python bench_money.py
+    python bench_money.py --count 1000000 --rows 2000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import EXPENSES_SCHEMA, MINOR_UNITS, format_money, format_money_many, migrate_money, parse_money
+
+
+# Форматирование суммы до перехода на копейки, для сравнения
+def legacy_format_money(amount):
+    amount_str = str(round(amount, 2))
+    if '.' in amount_str:
+        int_part, dec_part = amount_str.split('.')
+    else:
+        int_part = amount_str
+        dec_part = '0'
+
+    formatted_int = ''
+    for i, digit in enumerate(reversed(int_part)):
+        if i > 0 and i % 3 == 0:
+            formatted_int = "'" + formatted_int
+        formatted_int = digit + formatted_int
+
+    return f"{formatted_int},{dec_part.ljust(2, '0')}"
+
+
+# Время выполнения func() в секундах
+def measure(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+# Перенос rows расходов с REAL-суммами во временной БД
+def bench_migration(rows, rng):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "expenses.db"))
+        conn.execute(EXPENSES_SCHEMA.replace("amount INTEGER", "amount REAL").format(table='expenses'))
+        conn.executemany(
+            "INSERT INTO expenses (category_id, user_id, amount, date) VALUES (1, 1, ?, '2024-01-01')",
+            ((rng.randrange(10 ** 7) / MINOR_UNITS,) for _ in range(rows))
+        )
+        conn.commit()
+
+        cursor = conn.cursor()
+        elapsed = measure(lambda: migrate_money(cursor, 'main', {'expenses': EXPENSES_SCHEMA}))
+        conn.commit()
+        migrated = cursor.execute("SELECT COUNT(*) FROM expenses WHERE typeof(amount) = 'integer'").fetchone()[0]
+        conn.close()
+    return elapsed, migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200000, help="сколько сумм форматировать и разбирать")
+    parser.add_argument('--rows', type=int, default=200000, help="сколько расходов переносить на копейки")
+    parser.add_argument('--seed', type=int, default=31)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    amounts = [rng.randrange(10 ** 9) for _ in range(args.count)]
+    floats = [amount / MINOR_UNITS for amount in amounts]
+    texts = [f"{amount // MINOR_UNITS}.{amount % MINOR_UNITS:02d}" for amount in amounts]
+
+    legacy = measure(lambda: [legacy_format_money(amount) for amount in floats])
+    single = measure(lambda: [format_money(amount) for amount in amounts])
+    batch = measure(lambda: format_money_many(amounts))
+    parsing = measure(lambda: [parse_money(text) for text in texts])
+
+    print(f"Форматирование {args.count} сумм:")
+    print(f"  legacy_format_money  {legacy:7.3f} с")
+    print(f"  format_money         {single:7.3f} с  ({legacy / single:.1f}x)")
+    print(f"  format_money_many    {batch:7.3f} с  ({legacy / batch:.1f}x)")
+    print(f"Разбор {args.count} сумм parse_money: {parsing:.3f} с")
+
+    elapsed, migrated = bench_migration(args.rows, rng)
+    print(f"Перенос {args.rows} расходов на копейки: {elapsed:.3f} с, целых сумм {migrated}")
+
+
+if __name__ == '__main__':
+    main()
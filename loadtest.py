@@ -0,0 +1,463 @@
+"""
+Нагрузочный стенд для бота без выхода в сеть.
+
+Поднимает локальный поддельный Bot API, запускает настоящий main.py с
+BOT_API_BASE_URL, направленным на него, и прогоняет через бота сценарии
+множества пользователей: категории, лимиты, расходы, отчеты и поиск.
+Каждый вызов sendMessage/editMessageText записывается, по ним считаются
+задержка ответа, пропускная способность и ошибки.
+
+Примеры:
+    python loadtest.py --users 200 --iterations 20
+    python loadtest.py --mode webhook
+    python loadtest.py --record scenario.jsonl
+    python loadtest.py --replay scenario.jsonl --log calls.jsonl
+    DB_READ_POOL_SIZE=1 python loadtest.py --db-dir /tmp/big
+
+Переменные окружения передаются боту, поэтому конфигурации БД сравниваются
+запуском стенда с разными настройками. Пути к БД, архиву и копиям стенд
+задает сам внутри рабочего каталога, а .env развертывания на них не влияет.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+
+
+# Путь к запускаемому боту
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# Токен, с которым бот обращается к поддельному API
+FAKE_TOKEN = '123456:LOADTEST'
+
+# Пользователь-бот, от имени которого приходят ответы
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Finance bot', 'username': 'finance_loadtest_bot'}
+
+# Названия категорий и слова комментариев для сценариев
+CATEGORY_NAMES = ['Продукты', 'Кафе', 'Транспорт', 'Аптека', 'Связь', 'Дом', 'Одежда', 'Подарки', 'Кино', 'Спорт']
+NOTE_WORDS = ['аспирин', 'хлеб', 'такси', 'обед', 'кофе', 'бензин', 'молоко', 'книга', 'подарок', 'ремонт']
+
+
+# Поддельный Bot API: отдает обновления и записывает ответы бота
+class FakeBotAPI:
+    def __init__(self, on_reply, log_file=None):
+        self.on_reply = on_reply
+        self.log_file = log_file
+        self.pending = []
+        self.pending_event = asyncio.Event()
+        self.next_update_id = 1
+        self.message_ids = defaultdict(int)
+        self.calls = Counter()
+        self.api_errors = 0
+        self.polling = asyncio.Event()
+        self.webhook = None
+        self.webhook_event = asyncio.Event()
+
+    # Разбор HTTP/1.1 запросов одного соединения
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.dispatch(target, headers.get('content-type', ''), body)
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Вызов метода API по пути /bot<token>/<метод>
+    async def dispatch(self, target, content_type, body):
+        url = urlsplit(target)
+        method = url.path.rsplit('/', 1)[-1]
+        params = dict(parse_qsl(url.query))
+        if body:
+            if content_type.startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body.decode()))
+        self.calls[method] += 1
+
+        handler = getattr(self, f'api_{method}', None)
+        if handler is None:
+            self.api_errors += 1
+            return 404, {'ok': False, 'error_code': 404, 'description': f'Not Found: метод {method} не поддерживается'}
+        return 200, {'ok': True, 'result': await handler(params)}
+
+    async def api_getMe(self, params):
+        return BOT_USER
+
+    async def api_deleteWebhook(self, params):
+        self.webhook = None
+        return True
+
+    async def api_setWebhook(self, params):
+        self.webhook = (params['url'], params.get('secret_token'))
+        self.webhook_event.set()
+        return True
+
+    async def api_answerCallbackQuery(self, params):
+        return True
+
+    # Длинный опрос: ждем обновлений не дольше timeout секунд
+    async def api_getUpdates(self, params):
+        self.polling.set()
+        offset = int(params.get('offset', 0))
+        self.pending = [update for update in self.pending if update['update_id'] >= offset]
+        if not self.pending:
+            self.pending_event.clear()
+            try:
+                await asyncio.wait_for(self.pending_event.wait(), float(params.get('timeout', 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:int(params.get('limit', 100))]
+
+    async def api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        self.message_ids[chat_id] += 1
+        return self.reply('sendMessage', chat_id, self.message_ids[chat_id], params)
+
+    async def api_editMessageText(self, params):
+        return self.reply('editMessageText', int(params['chat_id']), int(params['message_id']), params)
+
+    # Ответ бота пользователю
+    def reply(self, method, chat_id, message_id, params):
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params['text'],
+        }
+        reply_markup = params.get('reply_markup')
+        if reply_markup:
+            message['reply_markup'] = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+
+        if self.log_file:
+            self.log_file.write(json.dumps(
+                {'time': time.time(), 'method': method, 'chat_id': chat_id, 'text': params['text']},
+                ensure_ascii=False) + '\n')
+        self.on_reply(chat_id, message)
+        return message
+
+    # Новое обновление для бота
+    def new_update(self, **payload):
+        update = {'update_id': self.next_update_id, **payload}
+        self.next_update_id += 1
+        return update
+
+    # Отдать обновление через getUpdates
+    def push(self, update):
+        self.pending.append(update)
+        self.pending_event.set()
+
+    # Завершить висящие длинные опросы перед остановкой
+    def close(self):
+        self.pending_event.set()
+
+
+# Сценарий одного пользователя: список действий ('send', текст) или ('press', текст кнопки)
+def build_scenario(iterations, rng):
+    categories = rng.sample(CATEGORY_NAMES, 3)
+    actions = [('send', '/start')]
+
+    for name in categories:
+        actions += [('send', '/categories'), ('press', 'Добавить категорию'), ('send', name)]
+    for name in categories:
+        actions += [('send', '/limits'), ('press', 'Установить лимит'), ('press', name),
+                    ('send', str(rng.randint(5, 50) * 1000))]
+
+    for _ in range(iterations):
+        name = rng.choice(categories)
+        amount = f"{rng.randint(50, 5000)},{rng.randint(0, 99):02d}"
+        note = rng.choice(NOTE_WORDS)
+        if rng.random() < 0.5:
+            actions += [('send', '/expense'), ('press', name), ('send', f'{amount} {note}')]
+        else:
+            actions.append(('send', f'/e {name} {amount}'))
+        if rng.random() < 0.2:
+            actions.append(('send', '/report'))
+        if rng.random() < 0.1:
+            actions.append(('send', f'/search {note}'))
+
+    actions.append(('send', '/report'))
+    return actions
+
+
+# Чтение записанного сценария: {user_id: [действия]}
+def load_scenarios(path):
+    scenarios = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                step = json.loads(line)
+                kind = 'send' if 'send' in step else 'press'
+                scenarios[step['user']].append((kind, step[kind]))
+    return scenarios
+
+
+# Запись сценария в формате, который читает load_scenarios
+def save_scenarios(path, scenarios):
+    with open(path, 'w', encoding='utf-8') as f:
+        for user_id, actions in scenarios.items():
+            for kind, text in actions:
+                f.write(json.dumps({'user': user_id, kind: text}, ensure_ascii=False) + '\n')
+
+
+# Процентиль по отсортированному списку
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Прогон сценариев через бота
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.waiters = {}
+        self.latencies = []
+        self.timeouts = 0
+        self.missing_buttons = 0
+        self.unsolicited = 0
+        self.aborted_users = 0
+        self.webhook_errors = 0
+        self.webhook_client = None
+        self.webhook_slots = None
+        self.api = None
+
+    # Ответ бота: будим пользователя, который его ждет
+    def on_reply(self, chat_id, message):
+        waiter = self.waiters.pop(chat_id, None)
+        if waiter is None or waiter.done():
+            # Например, продолжение длинного отчета или сообщение о тайм-ауте диалога
+            self.unsolicited += 1
+            return
+        waiter.set_result(message)
+
+    # Доставка обновления боту и ожидание его ответа
+    async def deliver(self, chat_id, update):
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = waiter
+        started = time.perf_counter()
+
+        if self.args.mode == 'polling':
+            self.api.push(update)
+        else:
+            asyncio.create_task(self.post_webhook(update))
+
+        try:
+            message = await asyncio.wait_for(waiter, self.args.reply_timeout)
+        except asyncio.TimeoutError:
+            self.waiters.pop(chat_id, None)
+            self.timeouts += 1
+            return None
+        self.latencies.append(time.perf_counter() - started)
+        return message
+
+    # Отправка обновления на вебхук бота, как это делает Telegram
+    async def post_webhook(self, update):
+        url, secret = self.api.webhook
+        headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+        async with self.webhook_slots:
+            try:
+                response = await self.webhook_client.post(url, json=update, headers=headers)
+                if response.status_code != 200:
+                    self.webhook_errors += 1
+            except httpx.HTTPError:
+                self.webhook_errors += 1
+
+    # Один пользователь: действие, ожидание ответа, следующее действие
+    async def run_user(self, user_id, actions):
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+        chat = {'id': user_id, 'type': 'private'}
+        last_message = None
+
+        for kind, text in actions:
+            if self.args.think_time:
+                await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+
+            if kind == 'send':
+                message = {'message_id': 0, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': text}
+                if text.startswith('/'):
+                    message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+                update = self.api.new_update(message=message)
+            else:
+                keyboard = (last_message or {}).get('reply_markup', {}).get('inline_keyboard', [])
+                button = next((b for row in keyboard for b in row if b['text'] == text), None)
+                if button is None:
+                    self.missing_buttons += 1
+                    self.aborted_users += 1
+                    return
+                update = self.api.new_update(callback_query={
+                    'id': f'{user_id}-{time.monotonic_ns()}',
+                    'from': user,
+                    'chat_instance': str(user_id),
+                    'message': {key: last_message[key] for key in ('message_id', 'date', 'chat', 'from', 'text')},
+                    'data': button['callback_data'],
+                })
+
+            last_message = await self.deliver(user_id, update)
+            if last_message is None:
+                self.aborted_users += 1
+                return
+
+    # Запуск бота в отдельном процессе
+    async def start_bot(self, api_url, workdir, bot_log):
+        workdir = os.path.abspath(workdir)
+        # main.py читает .env рядом с собой, то есть рабочий .env развертывания.
+        # Переменные окружения load_dotenv не перезаписывает, поэтому все пути
+        # и режим работы задаются явно: стенд не должен попасть в рабочую БД
+        env = dict(
+            os.environ,
+            TGbotTOKEN=FAKE_TOKEN,
+            BOT_API_BASE_URL=f'{api_url}/bot',
+            DB_PATH=os.path.join(workdir, 'expenses.db'),
+            ARCHIVE_DB_PATH=os.path.join(workdir, 'expenses_archive.db'),
+            BACKUP_DIR=os.path.join(workdir, 'backups'),
+            WEBHOOK_URL='',
+            DB_CREATE='1',
+        )
+        # Фоновые задачи только мешают замерам, если их не включили явно
+        env.setdefault('BACKUP_INTERVAL_HOURS', '0')
+        env.setdefault('ARCHIVE_AFTER_MONTHS', '0')
+        env.setdefault('LIMITS_CARRY_FORWARD', '0')
+        if self.args.mode == 'webhook':
+            env.update(
+                WEBHOOK_URL=f'http://127.0.0.1:{self.args.webhook_port}/webhook',
+                WEBHOOK_LISTEN='127.0.0.1',
+                WEBHOOK_PORT=str(self.args.webhook_port),
+                WEBHOOK_SECRET='loadtest',
+            )
+        return await asyncio.create_subprocess_exec(
+            sys.executable, MAIN_PATH, cwd=workdir, env=env, stdout=bot_log, stderr=asyncio.subprocess.STDOUT)
+
+    # Ожидание готовности бота принимать обновления
+    async def wait_ready(self, bot):
+        ready = self.api.polling if self.args.mode == 'polling' else self.api.webhook_event
+        ready_task = asyncio.create_task(ready.wait())
+        exit_task = asyncio.create_task(bot.wait())
+        done, _ = await asyncio.wait({ready_task, exit_task}, timeout=60, return_when=asyncio.FIRST_COMPLETED)
+        ready_task.cancel()
+        exit_task.cancel()
+        if ready_task not in done:
+            raise RuntimeError("Бот не запустился, подробности в логе бота")
+
+        if self.args.mode == 'webhook':
+            # setWebhook приходит до того, как сервер вебхука начал слушать порт
+            for _ in range(100):
+                try:
+                    await self.webhook_client.get(self.api.webhook[0])
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+    async def run(self):
+        args = self.args
+        if args.replay:
+            scenarios = load_scenarios(args.replay)
+        else:
+            rng = random.Random(args.seed)
+            scenarios = {user_id: build_scenario(args.iterations, rng) for user_id in range(1, args.users + 1)}
+        if args.record:
+            save_scenarios(args.record, scenarios)
+
+        workdir = args.db_dir or tempfile.mkdtemp(prefix='loadtest-')
+        log_file = open(args.log, 'w', encoding='utf-8') if args.log else None
+        self.api = FakeBotAPI(self.on_reply, log_file)
+        server = await asyncio.start_server(self.api.handle_connection, '127.0.0.1', args.port)
+        api_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        self.webhook_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=args.webhook_connections))
+        self.webhook_slots = asyncio.Semaphore(args.webhook_connections)
+
+        bot_log_path = os.path.join(workdir, 'bot.log')
+        with open(bot_log_path, 'ab') as bot_log:
+            bot = await self.start_bot(api_url, workdir, bot_log)
+            try:
+                await self.wait_ready(bot)
+                started = time.perf_counter()
+                await asyncio.gather(*(self.run_user(user_id, actions) for user_id, actions in scenarios.items()))
+                elapsed = time.perf_counter() - started
+            finally:
+                if bot.returncode is None:
+                    bot.send_signal(signal.SIGINT)
+                    try:
+                        await asyncio.wait_for(bot.wait(), 15)
+                    except asyncio.TimeoutError:
+                        bot.kill()
+                await self.webhook_client.aclose()
+                self.api.close()
+                server.close()
+                await asyncio.sleep(0)
+                if log_file:
+                    log_file.close()
+
+        self.report(scenarios, elapsed, workdir, bot_log_path)
+
+    # Итоги прогона
+    def report(self, scenarios, elapsed, workdir, bot_log_path):
+        latencies = sorted(latency * 1000 for latency in self.latencies)
+        answered = len(latencies)
+        errors = self.timeouts + self.missing_buttons + self.api.api_errors + self.webhook_errors
+        attempted = answered + self.timeouts + self.missing_buttons
+
+        print(f"Режим: {self.args.mode}, пользователей: {len(scenarios)}, "
+              f"действий в сценарии: {sum(len(actions) for actions in scenarios.values())}")
+        print(f"Обработано обновлений: {answered} за {elapsed:.2f} с, {answered / elapsed:.1f} обновлений/с")
+        print(f"Задержка ответа, мс: p50 {percentile(latencies, 0.5):.1f}, p90 {percentile(latencies, 0.9):.1f}, "
+              f"p99 {percentile(latencies, 0.99):.1f}, max {percentile(latencies, 1.0):.1f}")
+        print(f"Ошибки: {errors} ({errors / max(attempted, 1):.2%}): нет ответа {self.timeouts}, "
+              f"нет кнопки {self.missing_buttons}, неизвестные методы API {self.api.api_errors}, "
+              f"ошибки вебхука {self.webhook_errors}; прервано сценариев {self.aborted_users}")
+        print(f"Сообщения без ожидающего пользователя: {self.unsolicited}")
+        print("Вызовы Bot API: " + ", ".join(f"{method} {count}" for method, count in self.api.calls.most_common()))
+        print(f"БД и лог бота: {workdir} ({bot_log_path})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд бота с поддельным Bot API")
+    parser.add_argument('--users', type=int, default=100, help="количество пользователей")
+    parser.add_argument('--iterations', type=int, default=10, help="расходов на пользователя")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора сценариев")
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling', help="способ получения обновлений")
+    parser.add_argument('--think-time', type=float, default=0.0, help="средняя пауза пользователя между действиями, с")
+    parser.add_argument('--reply-timeout', type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument('--port', type=int, default=0, help="порт поддельного API, 0 - любой свободный")
+    parser.add_argument('--webhook-port', type=int, default=8443, help="порт вебхука бота")
+    parser.add_argument('--webhook-connections', type=int, default=40, help="одновременных запросов к вебхуку")
+    parser.add_argument('--db-dir', help="рабочий каталог бота с БД, по умолчанию новый временный")
+    parser.add_argument('--record', help="сохранить сценарий в JSONL")
+    parser.add_argument('--replay', help="прогнать сценарий из JSONL вместо сгенерированного")
+    parser.add_argument('--log', help="записать все ответы бота в JSONL")
+    asyncio.run(LoadTest(parser.parse_args()).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,76 @@
+import asyncio
+import glob
+import gzip
 import logging
 import os
+import queue
+import shutil
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from urllib.parse import urlsplit
+import pytz
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, \
-    filters, ContextTypes
+    TypeHandler, filters, ContextTypes
+
+
+# Суммы хранятся в копейках: 1 рубль = MINOR_UNITS копеек
+MINOR_UNITS = 100
+# Копейки в том виде, в каком они печатаются после запятой: 0 -> '00'.
+# Индекс в готовой таблице быстрее форматирования с вложенной шириной поля
+MINOR_TEXT = [f"{minor:0{len(str(MINOR_UNITS)) - 1}d}" for minor in range(MINOR_UNITS)]
+
+# Максимальная сумма в копейках, которую можно ввести
+MAX_AMOUNT = 10 ** 15
+
+
+# Перевод введенной пользователем суммы в копейки
+def parse_money(text):
+    """
+    Переводит строку вида 1234.56 или 1234,56 в целое число копеек 123456.
+    Бросает ValueError, если строка не является суммой
+    """
+    try:
+        amount = Decimal(text.strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {text}")
+
+    if not amount.is_finite() or abs(amount) * MINOR_UNITS >= MAX_AMOUNT:
+        raise ValueError(f"Некорректная сумма: {text}")
+
+    return int((amount * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
 
 
 # Функция форматирования денежных сумм
-def format_money(amount):
+def format_money_many(amounts):
     """
-    Форматирует денежную сумму из 1234.56 в формат 1'234,56
+    Форматирует суммы в копейках из 123456 в формат 1'234,56.
+    Все суммы собираются в одну строку, чтобы разделители тысяч
+    заменить одним вызовом replace на весь отчет
     """
-    # Округляем до 2 знаков после запятой
-    rounded_amount = round(amount, 2)
-    
-    # Преобразуем в строку и проверяем, есть ли десятичная точка
-    amount_str = str(rounded_amount)
-    if '.' in amount_str:
-        int_part, dec_part = amount_str.split('.')
-    else:
-        # Если точки нет, значит число целое
-        int_part = amount_str
-        dec_part = '0'
-    
-    # Форматируем целую часть с разделителями тысяч (апострофами)
-    formatted_int = ''
-    for i, digit in enumerate(reversed(int_part)):
-        if i > 0 and i % 3 == 0:
-            formatted_int = "'" + formatted_int
-        formatted_int = digit + formatted_int
-    
-    # Убеждаемся, что дробная часть имеет 2 знака
-    dec_part = dec_part.ljust(2, '0')
-    
-    # Соединяем части с запятой в качестве десятичного разделителя
-    return f"{formatted_int},{dec_part}"
+    # "".split("\n") вернул бы [''] вместо пустого списка
+    if not amounts:
+        return []
+
+    text = "\n".join([
+        f"{amount // MINOR_UNITS:_},{MINOR_TEXT[amount % MINOR_UNITS]}" if amount >= 0
+        else f"-{-amount // MINOR_UNITS:_},{MINOR_TEXT[-amount % MINOR_UNITS]}"
+        for amount in amounts
+    ])
+    return text.replace('_', "'").split("\n")
+
+
+# Форматирование одной суммы в копейках
+def format_money(amount):
+    return format_money_many((amount,))[0]
+
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -56,11 +90,212 @@ logger = logging.getLogger(__name__)
 ) = range(7)
 
 
+# Путь к файлу базы данных. Рядом с ним SQLite создает файлы -wal и -shm,
+# поэтому в контейнере монтируется весь каталог, а не один файл
+DB_PATH = os.getenv("DB_PATH", "expenses.db")
+# Разрешить создать новую пустую БД. Без этого отсутствие файла считается
+# ошибкой: бот, запущенный с неверным DB_PATH, не должен молча начать с нуля
+DB_CREATE = os.getenv("DB_CREATE", "0") == "1"
+
+# Сколько соединений только для чтения держать открытыми. Обработчики
+# вызываются по одному, так что пул нужен фоновым задачам (резервная копия,
+# архивация, перенос лимитов), а не параллельной обработке обновлений
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+
+# Единственное соединение для записи и блокировка, сериализующая запись
+writer_connection = None
+writer_lock = threading.Lock()
+
+# Пул соединений только для чтения
+read_pool = queue.LifoQueue()
+
+# Настройки резервного копирования
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+# Интервал между копиями в часах, 0 отключает резервное копирование
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+# Сколько последних копий хранить
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_GZIP = os.getenv("BACKUP_GZIP", "1") == "1"
+# Сколько страниц копировать за один шаг и сколько секунд ждать между шагами
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "1024"))
+BACKUP_STEP_PAUSE = float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
+
+# Архив старых расходов, по умолчанию рядом с основной БД
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "expenses_archive.db"))
+# Расходы старше стольких полных месяцев переносятся в архив, 0 отключает архивацию
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "0"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+# Сколько строк переносить за одну транзакцию и сколько секунд ждать между ними
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "5000"))
+ARCHIVE_CHUNK_PAUSE = float(os.getenv("ARCHIVE_CHUNK_PAUSE", "0.01"))
+# Сколько свободных страниц возвращать файловой системе за одну транзакцию
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "1000"))
+
+# Перенос лимитов прошлого месяца на новый месяц для всех пользователей, по умолчанию выключен
+LIMITS_CARRY_FORWARD = os.getenv("LIMITS_CARRY_FORWARD", "0") == "1"
+LIMITS_CARRY_FORWARD_INTERVAL_MINUTES = float(os.getenv("LIMITS_CARRY_FORWARD_INTERVAL_MINUTES", "15"))
+# Сколько лимитов переносить за одну транзакцию и сколько секунд ждать между ними
+LIMITS_CHUNK_SIZE = int(os.getenv("LIMITS_CHUNK_SIZE", "5000"))
+LIMITS_CHUNK_PAUSE = float(os.getenv("LIMITS_CHUNK_PAUSE", "0.01"))
+
+# Схема таблицы расходов, общая для основной БД и архива. Суммы в копейках
+EXPENSES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        category_id INTEGER,
+        user_id INTEGER,
+        amount INTEGER,
+        date DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        note TEXT,
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+'''
+
+# Полнотекстовый индекс комментариев к расходам. Индексируется и user_id,
+# чтобы поиск сразу пересекал слова запроса с расходами одного пользователя.
+# Расходы без комментария в индекс не попадают
+SEARCH_INDEX_SCHEMA = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.expenses_fts
+    USING fts5(note, user_id, content='expenses', content_rowid='id', prefix='2 3')
+'''
+
+# Триггеры, которые поддерживают индекс комментариев в актуальном состоянии
+SEARCH_INDEX_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.expenses_fts_insert
+    AFTER INSERT ON expenses WHEN new.note IS NOT NULL
+    BEGIN
+        INSERT INTO expenses_fts (rowid, note, user_id) VALUES (new.id, new.note, new.user_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.expenses_fts_delete
+    AFTER DELETE ON expenses WHEN old.note IS NOT NULL
+    BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, note, user_id)
+        VALUES ('delete', old.id, old.note, old.user_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.expenses_fts_update
+    AFTER UPDATE OF note, user_id ON expenses
+    BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, note, user_id)
+        SELECT 'delete', old.id, old.note, old.user_id WHERE old.note IS NOT NULL;
+        INSERT INTO expenses_fts (rowid, note, user_id)
+        SELECT new.id, new.note, new.user_id WHERE new.note IS NOT NULL;
+    END
+    ''',
+]
+
+# Схема таблицы лимитов по категориям. Суммы в копейках
+LIMITS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        category_id INTEGER,
+        user_id INTEGER,
+        amount INTEGER,
+        month INTEGER,
+        year INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        UNIQUE(category_id, month, year, user_id)
+    )
+'''
+
+
+# Подключить архив к соединению и создать представление all_expenses,
+# через которое исторические запросы читают и оперативные, и архивные расходы
+def attach_archive(conn, read_only):
+    if not os.path.exists(ARCHIVE_DB_PATH):
+        conn.execute("CREATE TEMP VIEW IF NOT EXISTS all_expenses AS SELECT * FROM main.expenses")
+        return
+
+    if read_only:
+        conn.execute("ATTACH DATABASE ? AS archive", (f"file:{ARCHIVE_DB_PATH}?mode=ro",))
+    else:
+        conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+    conn.execute('''
+        CREATE TEMP VIEW IF NOT EXISTS all_expenses AS
+        SELECT * FROM main.expenses
+        UNION ALL
+        SELECT * FROM archive.expenses
+    ''')
+
+
+# Соединение для записи. Все изменения БД идут только через него
+@contextmanager
+def write_db():
+    """
+    Обработчики вызывают write_db прямо в цикле событий, поэтому, пока
+    блокировку держит фоновая задача, бот не отвечает. Фоновые задачи
+    обязаны брать ее только на короткие порции работы и отпускать между ними
+    """
+    global writer_connection
+    with writer_lock:
+        if writer_connection is None:
+            writer_connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+            writer_connection.execute("PRAGMA busy_timeout = 5000")
+            # В режиме WAL synchronous=NORMAL не теряет целостность БД
+            writer_connection.execute("PRAGMA synchronous = NORMAL")
+            attach_archive(writer_connection, read_only=False)
+
+        cursor = writer_connection.cursor()
+        try:
+            yield cursor
+            writer_connection.commit()
+        except BaseException:
+            writer_connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Соединение только для чтения из пула. Все запросы внутри блока видят
+# один и тот же снимок WAL и не блокируют запись
+@contextmanager
+def read_db():
+    try:
+        conn = read_pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        attach_archive(conn, read_only=True)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        yield cursor
+    finally:
+        cursor.close()
+        conn.rollback()
+        if read_pool.qsize() < READ_POOL_SIZE:
+            read_pool.put(conn)
+        else:
+            conn.close()
+
+
 # Инициализация базы данных
 def init_db():
-    conn = sqlite3.connect('expenses.db')
+    if not os.path.exists(DB_PATH):
+        if not DB_CREATE:
+            raise FileNotFoundError(
+                f"БД {DB_PATH} не найдена. Если бот обновлен со старой схемы, перенесите "
+                f"expenses.db в каталог data (см. README). Для первого запуска задайте DB_CREATE=1"
+            )
+        logger.warning("БД %s не найдена, создается новая пустая БД", DB_PATH)
+
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
+    # Для новой БД включаем инкрементальную очистку, чтобы после архивации
+    # возвращать место без полного VACUUM
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # WAL позволяет читать снимок БД параллельно с записью
+    cursor.execute("PRAGMA journal_mode = WAL")
+
     # Таблица категорий
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS categories (
@@ -73,35 +308,61 @@ def init_db():
     ''')
 
     # Таблица лимитов по категориям
+    cursor.execute(LIMITS_SCHEMA.format(table='limits'))
+
+    # Месяц, на который лимиты уже перенесены, по часовым поясам. Хранится
+    # в БД, чтобы после перезапуска не проверять все лимиты заново
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS limits (
-        id INTEGER PRIMARY KEY,
-        category_id INTEGER,
-        user_id INTEGER,
-        amount REAL,
-        month INTEGER,
-        year INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (category_id) REFERENCES categories (id),
-        UNIQUE(category_id, month, year, user_id)
+    CREATE TABLE IF NOT EXISTS limits_carried_forward (
+        timezone TEXT PRIMARY KEY,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL
     )
     ''')
 
-    # Таблица расходов
+    # Таблица настроек пользователей
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS expenses (
-        id INTEGER PRIMARY KEY,
-        category_id INTEGER,
-        user_id INTEGER,
-        amount REAL,
-        date DATE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (category_id) REFERENCES categories (id)
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        timezone TEXT NOT NULL
     )
     ''')
 
+    # Таблица расходов
+    cursor.execute(EXPENSES_SCHEMA.format(table='expenses'))
+
     # Проверяем, нужно ли мигрировать данные
     migrate_db(cursor)
+    migrate_money(cursor, 'main', {'expenses': EXPENSES_SCHEMA, 'limits': LIMITS_SCHEMA})
+    migrate_notes(cursor, 'main')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date
+    ON expenses (user_id, category_id, date)
+    ''')
+    create_search_index(cursor, 'main')
+
+    # Перенос лимитов читает только лимиты прошлого месяца
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_limits_year_month_category
+    ON limits (year, month, category_id)
+    ''')
+
+    # Режим журнала нельзя менять внутри транзакции, открытой миграцией
+    conn.commit()
+
+    # Архивная БД с такой же таблицей расходов
+    if ARCHIVE_AFTER_MONTHS > 0 or os.path.exists(ARCHIVE_DB_PATH):
+        cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+        cursor.execute("PRAGMA archive.journal_mode = WAL")
+        cursor.execute(EXPENSES_SCHEMA.format(table='archive.expenses'))
+        migrate_money(cursor, 'archive', {'expenses': EXPENSES_SCHEMA})
+        migrate_notes(cursor, 'archive')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS archive.idx_expenses_user_category_date
+        ON expenses (user_id, category_id, date)
+        ''')
+        create_search_index(cursor, 'archive')
 
     conn.commit()
     conn.close()
@@ -176,6 +437,329 @@ def migrate_db(cursor):
         cursor.execute("ALTER TABLE expenses_new RENAME TO expenses")
 
 
+# Миграция сумм из REAL в целые копейки
+def migrate_money(cursor, schema, tables):
+    for table, table_schema in tables.items():
+        cursor.execute(f"PRAGMA {schema}.table_info({table})")
+        columns = {column[1]: column[2] for column in cursor.fetchall()}
+        if columns.get('amount', '').upper() != 'REAL':
+            continue
+
+        # Колонку с affinity REAL нельзя просто обновить: целые значения в ней
+        # снова станут числами с плавающей точкой, поэтому пересоздаем таблицу
+        names = ', '.join(columns)
+        values = ', '.join(
+            f"CAST(ROUND(amount * {MINOR_UNITS}) AS INTEGER)" if name == 'amount' else name
+            for name in columns
+        )
+        cursor.execute(table_schema.format(table=f"{schema}.{table}_new"))
+        cursor.execute(f"INSERT INTO {schema}.{table}_new ({names}) SELECT {values} FROM {schema}.{table}")
+        cursor.execute(f"DROP TABLE {schema}.{table}")
+        cursor.execute(f"ALTER TABLE {schema}.{table}_new RENAME TO {table}")
+
+
+# Миграция для добавления комментариев к расходам
+def migrate_notes(cursor, schema):
+    cursor.execute(f"PRAGMA {schema}.table_info(expenses)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'note' not in columns:
+        cursor.execute(f"ALTER TABLE {schema}.expenses ADD COLUMN note TEXT")
+
+
+# Создание полнотекстового индекса комментариев и триггеров к нему
+def create_search_index(cursor, schema):
+    cursor.execute(SEARCH_INDEX_SCHEMA.format(schema=schema))
+    for trigger in SEARCH_INDEX_TRIGGERS:
+        cursor.execute(trigger.format(schema=schema))
+
+
+# Полная перестройка индекса комментариев по данным таблиц расходов
+def rebuild_search_index():
+    """
+    Перестраивает индекс комментариев в основной БД и в архиве. Встроенная
+    команда 'rebuild' не подходит: она проиндексировала бы и расходы без
+    комментария, которых триггеры в индексе не ожидают
+    """
+    schemas = ['main']
+    if os.path.exists(ARCHIVE_DB_PATH):
+        schemas.append('archive')
+
+    with write_db() as cursor:
+        for schema in schemas:
+            cursor.execute(f"INSERT INTO {schema}.expenses_fts (expenses_fts) VALUES ('delete-all')")
+            cursor.execute(f'''
+                INSERT INTO {schema}.expenses_fts (rowid, note, user_id)
+                SELECT id, note, user_id FROM {schema}.expenses WHERE note IS NOT NULL
+            ''')
+            cursor.execute(f"INSERT INTO {schema}.expenses_fts (expenses_fts) VALUES ('optimize')")
+            logger.info("Индекс комментариев %s перестроен", schema)
+
+
+# Резервное копирование БД через online backup API SQLite
+def backup_file(path, name):
+    """
+    Копирует БД path по BACKUP_PAGES_PER_STEP страниц за шаг, проверяет
+    целостность копии, при необходимости сжимает её и удаляет старые копии
+    с тем же именем. Возвращает путь к созданной копии
+    """
+    snapshot_path = os.path.join(BACKUP_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.db")
+    started = time.monotonic()
+
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        try:
+            # Открытая транзакция чтения фиксирует снимок WAL: без неё любая запись
+            # в БД заставляла бы копирование начинаться заново
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+            # Пауза между шагами отдает процессор и GIL обработчикам бота
+            source.backup(
+                target,
+                pages=BACKUP_PAGES_PER_STEP,
+                progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_PAUSE)
+            )
+            source.rollback()
+
+            # Копия должна быть самодостаточным файлом без -wal
+            target.execute("PRAGMA journal_mode = DELETE")
+            integrity = target.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+
+        if integrity != 'ok':
+            raise sqlite3.DatabaseError(f"Резервная копия не прошла проверку целостности: {integrity}")
+
+        if BACKUP_GZIP:
+            with open(snapshot_path, 'rb') as raw, gzip.open(snapshot_path + '.gz', 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed, 1024 * 1024)
+            os.remove(snapshot_path)
+    except BaseException:
+        # Недоделанная копия попала бы в ротацию и вытеснила бы одну из целых
+        for partial in (snapshot_path, snapshot_path + '-journal', snapshot_path + '.gz'):
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise
+
+    if BACKUP_GZIP:
+        snapshot_path += '.gz'
+
+    # Оставляем только BACKUP_KEEP последних копий
+    snapshots = sorted(glob.glob(os.path.join(BACKUP_DIR, f"{name}-*.db*")))
+    for old_snapshot in snapshots[:-BACKUP_KEEP]:
+        os.remove(old_snapshot)
+
+    logger.info("Резервная копия %s создана за %.1f с", snapshot_path, time.monotonic() - started)
+    return snapshot_path
+
+
+# Резервное копирование основной БД и архива
+def backup_db():
+    """
+    Возвращает пути к созданным копиям. Копии основной БД и архива
+    снимаются по отдельности, поэтому расходы, перенесенные в архив
+    между ними, могут оказаться в обеих копиях, но не потеряются
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    # Основная БД копируется первой: расход, перенесенный после её копии,
+    # уже будет в копии архива
+    snapshot_paths = [backup_file(DB_PATH, "expenses")]
+    if os.path.exists(ARCHIVE_DB_PATH):
+        snapshot_paths.append(backup_file(ARCHIVE_DB_PATH, "expenses_archive"))
+    return snapshot_paths
+
+
+# Периодическая задача резервного копирования
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    # Копирование идет в отдельном потоке, чтобы не останавливать обработку сообщений
+    try:
+        await asyncio.to_thread(backup_db)
+    except (sqlite3.Error, OSError):
+        logger.exception("Не удалось создать резервную копию БД")
+
+
+# Перенос старых расходов из оперативной БД в архив
+def archive_expenses():
+    """
+    Переносит расходы старше ARCHIVE_AFTER_MONTHS полных месяцев в архив
+    порциями по ARCHIVE_CHUNK_SIZE строк, затем возвращает освободившееся
+    место. Возвращает количество перенесенных расходов
+    """
+    today = datetime.now().date()
+    months = today.year * 12 + today.month - 1 - ARCHIVE_AFTER_MONTHS
+    cutoff = f"{months // 12:04d}-{months % 12 + 1:02d}-01"
+    started = time.monotonic()
+    moved = 0
+
+    while True:
+        # Каждая порция — отдельная короткая транзакция, чтобы не задерживать
+        # запись из обработчиков. INSERT OR IGNORE позволяет безопасно повторить
+        # порцию, если процесс остановился между фиксацией архива и основной БД
+        with write_db() as cursor:
+            cursor.execute("""
+                SELECT MIN(id), MAX(id) FROM (
+                    SELECT id FROM main.expenses WHERE date < ? ORDER BY id LIMIT ?
+                )
+            """, (cutoff, ARCHIVE_CHUNK_SIZE))
+            first_id, last_id = cursor.fetchone()
+            if first_id is None:
+                break
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO archive.expenses
+                SELECT * FROM main.expenses WHERE id BETWEEN ? AND ? AND date < ?
+            """, (first_id, last_id, cutoff))
+            cursor.execute("""
+                DELETE FROM main.expenses WHERE id BETWEEN ? AND ? AND date < ?
+            """, (first_id, last_id, cutoff))
+            moved += cursor.rowcount
+
+        time.sleep(ARCHIVE_CHUNK_PAUSE)
+
+    if moved:
+        with read_db() as cursor:
+            cursor.execute("PRAGMA main.auto_vacuum")
+            incremental = cursor.fetchone()[0] == 2
+
+        if incremental:
+            # Место возвращается порциями по ARCHIVE_VACUUM_PAGES страниц, чтобы
+            # не держать блокировку записи, пока освобождается весь файл
+            while True:
+                with write_db() as cursor:
+                    cursor.execute("PRAGMA main.freelist_count")
+                    if cursor.fetchone()[0] == 0:
+                        break
+                    # Прагма освобождает по одной странице за шаг и не возвращает
+                    # столбцов, поэтому execute остановился бы после первой страницы.
+                    # executescript выполняет её до конца
+                    cursor.executescript(f"PRAGMA main.incremental_vacuum({ARCHIVE_VACUUM_PAGES})")
+                time.sleep(ARCHIVE_CHUNK_PAUSE)
+        else:
+            # Полный VACUUM старой БД надолго остановил бы бота,
+            # поэтому он выполняется только отдельной командой
+            logger.warning(
+                "БД создана без auto_vacuum, место после архивации не освобождено. "
+                "Остановите бота и выполните python main.py --vacuum"
+            )
+
+    logger.info("В архив перенесено %d расходов до %s за %.1f с", moved, cutoff, time.monotonic() - started)
+    return moved
+
+
+# Полная очистка БД с переводом в инкрементальный режим
+def vacuum_db():
+    """
+    Выполняется при остановленном боте: VACUUM переписывает всю БД
+    и все это время не дает в нее писать
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        started = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info("VACUUM выполнен за %.1f с", time.monotonic() - started)
+    finally:
+        conn.close()
+
+
+# Периодическая задача архивации старых расходов
+async def archive_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await asyncio.to_thread(archive_expenses)
+    except sqlite3.Error:
+        logger.exception("Не удалось перенести расходы в архив")
+
+
+# Перенос лимитов прошлого месяца на текущий для всех пользователей
+def carry_forward_limits():
+    """
+    Новый месяц наступает в разных часовых поясах в разное время, поэтому
+    пояса группируются по текущему месяцу, и для каждой группы выполняется
+    один INSERT ... SELECT порциями по LIMITS_CHUNK_SIZE лимитов прошлого
+    месяца в порядке category_id (по индексу year, month, category_id).
+    INSERT OR IGNORE не трогает уже установленные лимиты, так что повторный
+    запуск безопасен. Возвращает число новых лимитов
+    """
+    with read_db() as cursor:
+        cursor.execute("SELECT DISTINCT timezone FROM user_settings")
+        zones = {row[0] for row in cursor.fetchall()} | {DEFAULT_TIMEZONE}
+        cursor.execute("SELECT timezone, year, month FROM limits_carried_forward")
+        carried = {zone: (year, month) for zone, year, month in cursor.fetchall()}
+
+    groups = {}
+    for zone in zones:
+        period = period_in_zone(pytz.timezone(zone))
+        if carried.get(zone) != (period.year, period.month):
+            groups.setdefault((period.year, period.month), []).append(zone)
+
+    # Одно значение created_at на весь перенос дешевле, чем CURRENT_TIMESTAMP для каждой строки
+    created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    copied = 0
+    for (year, month), group_zones in groups.items():
+        previous = Period(year, month).previous()
+
+        # Пока месяц сменился не во всех поясах, берем только пользователей из нужных
+        zone_filter = ""
+        zone_params = ()
+        if len(group_zones) < len(zones):
+            zone_filter = f'''
+                AND COALESCE(
+                    (SELECT timezone FROM user_settings s WHERE s.user_id = limits.user_id), ?
+                ) IN ({', '.join('?' * len(group_zones))})
+            '''
+            zone_params = (DEFAULT_TIMEZONE, *group_zones)
+
+        last_category_id = -1
+        while True:
+            with write_db() as cursor:
+                cursor.execute('''
+                    SELECT MAX(category_id) FROM (
+                        SELECT category_id FROM limits
+                        WHERE year = ? AND month = ? AND category_id > ?
+                        ORDER BY category_id LIMIT ?
+                    )
+                ''', (previous.year, previous.month, last_category_id, LIMITS_CHUNK_SIZE))
+                chunk_end = cursor.fetchone()[0]
+                if chunk_end is None:
+                    break
+
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO limits (category_id, user_id, amount, month, year, created_at)
+                    SELECT category_id, user_id, amount, ?, ?, ? FROM limits
+                    WHERE year = ? AND month = ? AND category_id > ? AND category_id <= ? {zone_filter}
+                ''', (month, year, created_at, previous.year, previous.month,
+                      last_category_id, chunk_end, *zone_params))
+                copied += cursor.rowcount
+            last_category_id = chunk_end
+            time.sleep(LIMITS_CHUNK_PAUSE)
+
+        with write_db() as cursor:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO limits_carried_forward (timezone, year, month) VALUES (?, ?, ?)",
+                [(zone, year, month) for zone in group_zones]
+            )
+        logger.info("Лимиты за %s/%s перенесены на %s/%s для поясов: %s",
+                    previous.month, previous.year, month, year, ', '.join(sorted(group_zones)))
+
+    return copied
+
+
+# Периодический перенос лимитов на новый месяц
+async def carry_forward_limits_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        copied = await asyncio.to_thread(carry_forward_limits)
+    except sqlite3.Error:
+        logger.exception("Не удалось перенести лимиты на новый месяц")
+        return
+
+    if copied:
+        # Версии данных у всех пользователей сразу не поднять, проще сбросить кэш целиком
+        render_cache.clear()
+        logger.info("Перенесено лимитов: %s", copied)
+
+
 # Команда /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -184,8 +768,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'Доступные команды:\n'
         '/categories - управление категориями\n'
         '/limits - управление лимитами расходов\n'
+        '/limits copy - перенести лимиты с прошлого месяца\n'
         '/expense - добавить расход\n'
-        '/report - показать отчет по расходам'
+        '/e <категория> <сумма> - быстро добавить расход\n'
+        '/search <слова> - найти расходы по комментарию\n'
+        '/report [ММ/ГГГГ] - показать отчет по расходам\n'
+        '/timezone [пояс] - часовой пояс для дат расходов'
     )
 
 
@@ -211,63 +799,429 @@ def get_user_id(update: Update):
 
 # Получить список категорий из БД
 def get_categories(user_id):
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
-    categories = cursor.fetchall()
-    conn.close()
-    return categories
+    with read_db() as cursor:
+        cursor.execute("SELECT id, name FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
+        return cursor.fetchall()
 
 
-# Обработка списка категорий
-async def list_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    user_id = get_user_id(update)
-    categories = get_categories(user_id)
+# Получить название категории пользователя или None, если она не найдена
+def get_category_name(user_id, cat_id):
+    with read_db() as cursor:
+        cursor.execute("SELECT name FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
+        cat_name_data = cursor.fetchone()
+    return cat_name_data[0] if cat_name_data else None
 
-    if not categories:
-        await query.edit_message_text("У вас еще нет категорий. Создайте их с помощью команды 'Добавить категорию'.")
-        return
 
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+# Часовой пояс пользователей, которые не выбрали свой
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
 
-    result = "📋 Список категорий и остаток лимита:\n\n"
-    total_limit = 0
-    total_spent = 0
+# Расчетный период: календарный месяц в часовом поясе пользователя
+class Period:
+    """
+    Расходы хранят дату в часовом поясе пользователя, поэтому месяц
+    выбирается условием start <= date < end, которое идет по индексу.
+    today заполняется только для текущего периода
+    """
+    __slots__ = ('year', 'month', 'start', 'end', 'today')
 
-    for cat_id, cat_name in categories:
-        # Получаем лимит для текущего месяца
-        cursor.execute("""
-            SELECT amount FROM limits 
-            WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
-        """, (cat_id, current_month, current_year, user_id))
-        limit_data = cursor.fetchone()
-        limit_amount = limit_data[0] if limit_data else 0
-        total_limit += limit_amount
+    def __init__(self, year, month, today=None):
+        self.year = year
+        self.month = month
+        self.start = f"{year:04d}-{month:02d}-01"
+        self.end = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+        self.today = today
 
-        # Получаем сумму расходов по категории за текущий месяц
-        cursor.execute("""
-            SELECT SUM(amount) FROM expenses 
-            WHERE category_id = ? AND strftime('%m', date) = ? AND strftime('%Y', date) = ? AND user_id = ?
-        """, (cat_id, f"{current_month:02d}", str(current_year), user_id))
+    # Предыдущий месяц
+    def previous(self):
+        return Period(self.year, self.month - 1) if self.month > 1 else Period(self.year - 1, 12)
 
-        spent_data = cursor.fetchone()
-        spent_amount = spent_data[0] if spent_data[0] else 0
-        total_spent += spent_amount
 
-        # Вычисляем остаток
-        remaining = limit_amount - spent_amount
+# Часовые пояса пользователей по user_id
+user_timezones = {}
+
+
+# Часовой пояс пользователя
+def get_user_timezone(user_id):
+    tz_name = user_timezones.get(user_id)
+    if tz_name is None:
+        with read_db() as cursor:
+            cursor.execute("SELECT timezone FROM user_settings WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+        tz_name = row[0] if row else DEFAULT_TIMEZONE
+        user_timezones[user_id] = tz_name
+    return pytz.timezone(tz_name)
+
+
+# Сохранить часовой пояс пользователя
+def set_user_timezone(user_id, tz_name):
+    with write_db() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO user_settings (user_id, timezone) VALUES (?, ?)", (user_id, tz_name))
+    user_timezones[user_id] = tz_name
+
+
+# Текущий период пользователя, считается один раз на обновление
+def current_period(user_id, now=None):
+    return period_in_zone(get_user_timezone(user_id), now)
+
+
+# Текущий период в часовом поясе
+def period_in_zone(tz, now=None):
+    """
+    Месяц берется из местной даты: fromtimestamp сам учитывает переходы
+    на летнее время, в том числе повторяющуюся или пропущенную полночь
+    """
+    now = time.time() if now is None else now
+    today = datetime.fromtimestamp(now, tz).date()
+    return Period(today.year, today.month, today)
+
+
+# Максимальное число вариантов, предлагаемых при неоднозначном быстром вводе
+QUICK_EXPENSE_MAX_CANDIDATES = 10
+
+
+# Индекс названий категорий одного пользователя: префиксное дерево + нечеткий поиск
+class CategoryIndex:
+    """
+    Ищет категорию по началу названия, а если совпадений нет — по расстоянию
+    редактирования, чтобы прощать опечатки
+    """
+    __slots__ = ('root', 'names')
+
+    def __init__(self, categories):
+        # Узел дерева — словарь "символ -> узел", категории хранятся списком под ключом ''.
+        # Названия уникальны с учетом регистра, поэтому "Кафе" и "кафе" попадают в один узел
+        self.root = {}
+        self.names = {}
+        for cat_id, cat_name in categories:
+            key = cat_name.lower()
+            self.names.setdefault(key, []).append((cat_id, cat_name))
+            node = self.root
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault('', []).append((cat_id, cat_name))
+
+    def with_prefix(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        found = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char == '':
+                    found.extend(child)
+                else:
+                    stack.append(child)
+        return sorted(found, key=lambda category: category[1])
+
+    def match(self, query):
+        key = ' '.join(query.lower().split())
+        if not key:
+            return []
+
+        # Точное совпадение однозначно, если только названия не различаются одним регистром
+        if key in self.names:
+            exact = self.names[key]
+            same_case = [category for category in exact if category[1] == ' '.join(query.split())]
+            return same_case or sorted(exact, key=lambda category: category[1])
+
+        found = self.with_prefix(key)
+        if found:
+            return found
+
+        # Допускаем одну опечатку в коротких словах и две в длинных
+        limit = 1 if len(key) <= 7 else 2
+        # Категория -> (расстояние до всего названия, лучшее расстояние до его начала)
+        distances = {}
+
+        # Обходим дерево, считая строку матрицы Левенштейна для каждого узла,
+        # и отсекаем ветки, где расстояние заведомо больше limit. Ячейки дальше
+        # limit от диагонали не считаем: в них расстояние всегда больше limit
+        size = len(key)
+        too_far = limit + 1
+        stack = [(self.root, 0, list(range(size + 1)), too_far)]
+        while stack:
+            node, depth, row, best = stack.pop()
+            depth += 1
+            first = max(1, depth - limit)
+            last = min(size, depth + limit)
+            for char, child in node.items():
+                if char == '':
+                    if best <= limit:
+                        # row[-1] — расстояние до всего названия, за пределами полосы оно равно too_far
+                        for category in child:
+                            distances[category] = (row[-1], best)
+                    continue
+
+                next_row = [too_far] * (size + 1)
+                if depth <= limit:
+                    next_row[0] = depth
+                row_min = next_row[0]
+                for i in range(first, last + 1):
+                    cost = row[i - 1] if key[i - 1] == char else row[i - 1] + 1
+                    if row[i] + 1 < cost:
+                        cost = row[i] + 1
+                    if next_row[i - 1] + 1 < cost:
+                        cost = next_row[i - 1] + 1
+                    next_row[i] = cost
+                    if cost < row_min:
+                        row_min = cost
+                # next_row[-1] — расстояние от запроса до текущего префикса названия
+                if row_min <= limit:
+                    stack.append((child, depth, next_row, min(best, next_row[-1])))
+                elif best <= limit:
+                    stack.append((child, depth, next_row, best))
+
+        if not distances:
+            return []
+        best_distance = min(distances.values())
+        found = [category for category, distance in distances.items() if distance == best_distance]
+        return sorted(found, key=lambda category: category[1])
+
+
+# Сколько индексов категорий держать в памяти
+CATEGORY_INDEX_CACHE_SIZE = int(os.getenv("CATEGORY_INDEX_CACHE_SIZE", "1000"))
+
+# Индексы категорий по user_id, строятся при первом обращении.
+# Давно не использованные вытесняются, индекс строится заново при следующем /e
+category_indexes = OrderedDict()
+
+
+# Получить индекс категорий пользователя
+def get_category_index(user_id):
+    index = category_indexes.get(user_id)
+    if index is None:
+        index = CategoryIndex(get_categories(user_id))
+        category_indexes[user_id] = index
+        while len(category_indexes) > CATEGORY_INDEX_CACHE_SIZE:
+            category_indexes.popitem(last=False)
+    else:
+        category_indexes.move_to_end(user_id)
+    return index
 
+
+# Сбросить индекс категорий пользователя после изменения списка категорий
+def invalidate_category_index(user_id):
+    category_indexes.pop(user_id, None)
+
+
+# Сколько секунд ждать следующего шага диалога, прежде чем его забыть
+FLOW_TTL_SECONDS = int(os.getenv("FLOW_TTL_SECONDS", "900"))
+
+
+# Состояние незавершенного диалога: категория, выбранная на предыдущем шаге
+class FlowState:
+    """
+    Хранит данные между шагами диалога. Удаляется, когда диалог завершается,
+    отменяется или не продолжается дольше FLOW_TTL_SECONDS
+    """
+    __slots__ = ('category_id', 'category_name', 'expires_at')
+    category_id: int
+    category_name: str
+    expires_at: float
+
+    def __init__(self, category_id: int, category_name: str):
+        self.category_id = category_id
+        self.category_name = category_name
+        self.expires_at = time.monotonic() + FLOW_TTL_SECONDS
+
+
+# Незавершенные диалоги по (user_id, flow). flow — имя диалога: пользователь
+# может начать один диалог, не закончив другой, и их состояния не должны смешиваться
+flow_states = {}
+
+
+# Запомнить категорию, выбранную пользователем в диалоге flow
+def start_flow(user_id, flow, category_id, category_name):
+    flow_states[(user_id, flow)] = FlowState(int(category_id), category_name)
+
+
+# Получить состояние диалога flow или None, если его нет или оно устарело
+def get_flow(user_id, flow):
+    state = flow_states.get((user_id, flow))
+    if state is None or state.expires_at < time.monotonic():
+        return None
+    return state
+
+
+# Забыть состояние диалога flow
+def end_flow(user_id, flow):
+    flow_states.pop((user_id, flow), None)
+
+
+# Последний поисковый запрос пользователя, нужен для перелистывания результатов
+class SearchState:
+    __slots__ = ('terms', 'message_id', 'expires_at')
+    terms: str
+    message_id: int | None
+    expires_at: float
+
+    def __init__(self, terms: str):
+        self.terms = terms
+        # Сообщение, под которым сейчас кнопки перелистывания этого запроса
+        self.message_id = None
+        self.expires_at = time.monotonic() + FLOW_TTL_SECONDS
+
+
+# Поисковые запросы по user_id
+search_states = {}
+
+
+# Удалить состояния брошенных диалогов и поисков, возвращает количество удаленных
+def sweep_flows():
+    now = time.monotonic()
+    removed = 0
+    for states in (flow_states, search_states):
+        live = {key: state for key, state in states.items() if state.expires_at >= now}
+        if len(live) < len(states):
+            removed += len(states) - len(live)
+            # Удаление ключей не уменьшает таблицу словаря, поэтому после
+            # наплыва пользователей память не вернулась бы. clear() её освобождает
+            states.clear()
+            states.update(live)
+    return removed
+
+
+# Периодическая очистка брошенных диалогов
+async def sweep_flows_job(context: ContextTypes.DEFAULT_TYPE):
+    removed = sweep_flows()
+    if removed:
+        logger.info("Удалено %d незавершенных диалогов", removed)
+
+
+# Обработчик таймаута диалога flow
+def flow_timeout(flow):
+    async def timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        end_flow(get_user_id(update), flow)
+        return ConversationHandler.END
+    return timeout
+
+
+# Сообщение, если состояние диалога уже удалено
+FLOW_EXPIRED_MESSAGE = "Время ожидания истекло. Начните действие заново."
+
+
+# Максимальная длина сообщения Telegram в кодовых единицах UTF-16
+MESSAGE_LIMIT = 4096
+
+# Сколько отрисованных отчетов держать в памяти
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+
+# Версия данных пользователя, увеличивается при любой записи расходов, лимитов или категорий
+data_versions = {}
+
+# Отрисованные отчеты: (user_id, вид, год, месяц) -> (версия данных, сообщения)
+render_cache = OrderedDict()
+
+
+# Отметить, что данные пользователя изменились и отчеты нужно перерисовать
+def bump_data_version(user_id):
+    data_versions[user_id] = data_versions.get(user_id, 0) + 1
+
+
+# Получить отчет из кэша или отрисовать его, если данные изменились
+def cached_render(user_id, kind, year, month, render):
+    key = (user_id, kind, year, month)
+    version = data_versions.get(user_id, 0)
+
+    cached = render_cache.get(key)
+    if cached is not None and cached[0] == version:
+        render_cache.move_to_end(key)
+        return cached[1]
+
+    messages = render()
+    render_cache[key] = (version, messages)
+    render_cache.move_to_end(key)
+    while len(render_cache) > RENDER_CACHE_SIZE:
+        render_cache.popitem(last=False)
+    return messages
+
+
+# Длина строки так, как её считает Telegram
+def telegram_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+# Собрать строки отчета в сообщения, каждое не длиннее MESSAGE_LIMIT
+def split_message(lines):
+    messages = []
+    current = []
+    current_length = 0
+
+    for line in lines:
+        # Строку длиннее лимита режем на куски, это возможно только при очень длинном названии
+        while telegram_length(line) > MESSAGE_LIMIT:
+            cut = MESSAGE_LIMIT // 2
+            if current:
+                messages.append("\n".join(current).strip("\n"))
+                current, current_length = [], 0
+            messages.append(line[:cut])
+            line = line[cut:]
+
+        line_length = telegram_length(line) + (1 if current else 0)
+        if current and current_length + line_length > MESSAGE_LIMIT:
+            messages.append("\n".join(current).strip("\n"))
+            current, current_length = [], 0
+            line_length = telegram_length(line)
+        current.append(line)
+        current_length += line_length
+
+    if current:
+        messages.append("\n".join(current).strip("\n"))
+    # Telegram не принимает пустые сообщения
+    return [message for message in messages if message]
+
+
+# Отрисовка списка категорий с остатком лимита за месяц
+def render_category_list(user_id, period):
+    categories = get_categories(user_id)
+
+    if not categories:
+        return ["У вас еще нет категорий. Создайте их с помощью команды 'Добавить категорию'."]
+
+    lines = ["📋 Список категорий и остаток лимита:", ""]
+    total_limit = 0
+    total_spent = 0
+    rows = []
+
+    with read_db() as cursor:
+        for cat_id, cat_name in categories:
+            # Получаем лимит для текущего месяца
+            cursor.execute("""
+                SELECT amount FROM limits 
+                WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
+            """, (cat_id, period.month, period.year, user_id))
+            limit_data = cursor.fetchone()
+            limit_amount = limit_data[0] if limit_data else 0
+            total_limit += limit_amount
+
+            # Получаем сумму расходов по категории за текущий месяц
+            cursor.execute("""
+                SELECT SUM(amount) FROM expenses 
+                WHERE user_id = ? AND category_id = ? AND date >= ? AND date < ?
+            """, (user_id, cat_id, period.start, period.end))
+
+            spent_data = cursor.fetchone()
+            spent_amount = spent_data[0] if spent_data[0] else 0
+            total_spent += spent_amount
+
+            rows.append((cat_name, limit_amount, limit_amount - spent_amount))
+
+    # Форматируем все суммы списка за один проход
+    limits_text = format_money_many([limit_amount for _, limit_amount, _ in rows])
+    remaining_text = format_money_many([abs(remaining) for _, _, remaining in rows])
+
+    for (cat_name, _, remaining), limit_text, left_text in zip(rows, limits_text, remaining_text):
         if remaining >= 0:
-            result += f"✅ {cat_name}: осталось {format_money(remaining)} из {format_money(limit_amount)}\n"
+            lines.append(f"✅ {cat_name}: осталось {left_text} из {limit_text}")
         else:
-            result += f"❌ {cat_name}: перерасход {format_money(abs(remaining))} (лимит {format_money(limit_amount)})\n"
+            lines.append(f"❌ {cat_name}: перерасход {left_text} (лимит {limit_text})")
 
     # Общая статистика
     if total_limit > 0:
@@ -282,13 +1236,35 @@ async def list_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     remaining_percent = (remaining_funds / total_limit) * 100 if total_limit > 0 else 0
 
     # Добавляем итоговую информацию
-    result += f"\nИТОГО {total_status}:\n"
-    result += f"Общий лимит: {format_money(total_limit)}\n"
-    result += f"Общие расходы: {format_money(total_spent)} ({total_percent:.1f}%)\n"
-    result += f"Остаток средств: {format_money(remaining_funds)} ({remaining_percent:.1f}%)"
+    total_limit_text, total_spent_text, remaining_funds_text = format_money_many(
+        (total_limit, total_spent, remaining_funds))
 
-    conn.close()
-    await query.edit_message_text(result)
+    lines.append("")
+    lines.append(f"ИТОГО {total_status}:")
+    lines.append(f"Общий лимит: {total_limit_text}")
+    lines.append(f"Общие расходы: {total_spent_text} ({total_percent:.1f}%)")
+    lines.append(f"Остаток средств: {remaining_funds_text} ({remaining_percent:.1f}%)")
+
+    return split_message(lines)
+
+
+# Обработка списка категорий
+async def list_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = get_user_id(update)
+    period = current_period(user_id)
+
+    messages = cached_render(
+        user_id, 'list', period.year, period.month,
+        lambda: render_category_list(user_id, period)
+    )
+
+    # Первая часть заменяет меню, остальные приходят отдельными сообщениями
+    await query.edit_message_text(messages[0])
+    for message in messages[1:]:
+        await query.message.reply_text(message)
 
 
 # Начало добавления категории
@@ -309,17 +1285,14 @@ async def add_category_finish(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Название категории не может быть пустым. Попробуйте снова.")
         return CATEGORY_NAME
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("INSERT INTO categories (name, user_id) VALUES (?, ?)", (category_name, user_id))
-        conn.commit()
+        with write_db() as cursor:
+            cursor.execute("INSERT INTO categories (name, user_id) VALUES (?, ?)", (category_name, user_id))
+        invalidate_category_index(user_id)
+        bump_data_version(user_id)
         await update.message.reply_text(f"Категория '{category_name}' успешно добавлена!")
     except sqlite3.IntegrityError:
         await update.message.reply_text(f"Категория с названием '{category_name}' уже существует.")
-    finally:
-        conn.close()
 
     return ConversationHandler.END
 
@@ -351,24 +1324,15 @@ async def edit_category_select(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     cat_id = query.data.split('_')[1]
-    context.user_data['edit_category_id'] = cat_id
-    
     user_id = get_user_id(update)
-    context.user_data['user_id'] = user_id
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-    cat_name_data = cursor.fetchone()
+    cat_name = get_category_name(user_id, cat_id)
     
-    if not cat_name_data:
+    if not cat_name:
         await query.edit_message_text("Категория не найдена или у вас нет доступа к ней.")
-        conn.close()
         return ConversationHandler.END
         
-    cat_name = cat_name_data[0]
-    context.user_data['edit_category_name'] = cat_name
-    conn.close()
+    start_flow(user_id, 'edit_category', cat_id, cat_name)
 
     await query.edit_message_text(f"Текущее название: {cat_name}\nВведите новое название категории:")
     return CATEGORY_EDIT
@@ -377,32 +1341,36 @@ async def edit_category_select(update: Update, context: ContextTypes.DEFAULT_TYP
 # Завершение редактирования категории
 async def edit_category_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_name = update.message.text.strip()
-    cat_id = context.user_data.get('edit_category_id')
-    user_id = context.user_data.get('user_id', get_user_id(update))
+    user_id = get_user_id(update)
+    state = get_flow(user_id, 'edit_category')
+
+    if state is None:
+        await update.message.reply_text(FLOW_EXPIRED_MESSAGE)
+        return ConversationHandler.END
 
     if not new_name:
         await update.message.reply_text("Название категории не может быть пустым. Попробуйте снова.")
         return CATEGORY_EDIT
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
+    cat_id = state.category_id
+    end_flow(user_id, 'edit_category')
 
     try:
-        # Проверяем, что категория принадлежит пользователю
-        cursor.execute("SELECT id FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-        if not cursor.fetchone():
-            await update.message.reply_text("У вас нет доступа к этой категории.")
-            conn.close()
-            return ConversationHandler.END
-            
-        # Обновляем название категории
-        cursor.execute("UPDATE categories SET name = ? WHERE id = ? AND user_id = ?", (new_name, cat_id, user_id))
-        conn.commit()
-        await update.message.reply_text(f"Название категории успешно изменено на '{new_name}'!")
+        with write_db() as cursor:
+            # Обновляем название категории, только если она принадлежит пользователю
+            cursor.execute("UPDATE categories SET name = ? WHERE id = ? AND user_id = ?", (new_name, cat_id, user_id))
+            updated = cursor.rowcount
     except sqlite3.IntegrityError:
         await update.message.reply_text(f"Категория с названием '{new_name}' уже существует.")
-    finally:
-        conn.close()
+        return ConversationHandler.END
+
+    if not updated:
+        await update.message.reply_text("У вас нет доступа к этой категории.")
+        return ConversationHandler.END
+
+    invalidate_category_index(user_id)
+    bump_data_version(user_id)
+    await update.message.reply_text(f"Название категории успешно изменено на '{new_name}'!")
 
     return ConversationHandler.END
 
@@ -435,23 +1403,14 @@ async def delete_category_confirm(update: Update, context: ContextTypes.DEFAULT_
 
     cat_id = query.data.split('_')[1]
     user_id = get_user_id(update)
-    context.user_data['user_id'] = user_id
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-    cat_name_data = cursor.fetchone()
+    cat_name = get_category_name(user_id, cat_id)
     
-    if not cat_name_data:
+    if not cat_name:
         await query.edit_message_text("Категория не найдена или у вас нет доступа к ней.")
-        conn.close()
         return ConversationHandler.END
-        
-    cat_name = cat_name_data[0]
-    conn.close()
 
-    context.user_data['delete_category_id'] = cat_id
-    context.user_data['delete_category_name'] = cat_name
+    start_flow(user_id, 'delete_category', cat_id, cat_name)
 
     keyboard = [
         [InlineKeyboardButton("Да, удалить", callback_data=f'confirm_delete_{cat_id}')],
@@ -472,28 +1431,39 @@ async def delete_category_finish(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
 
-    if query.data.startswith('confirm_delete_'):
-        cat_id = context.user_data.get('delete_category_id')
-        cat_name = context.user_data.get('delete_category_name')
-        user_id = context.user_data.get('user_id', get_user_id(update))
-
-        conn = sqlite3.connect('expenses.db')
-        cursor = conn.cursor()
-
-        # Проверяем, что категория принадлежит пользователю
-        cursor.execute("SELECT id FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-        if not cursor.fetchone():
+    user_id = get_user_id(update)
+    state = get_flow(user_id, 'delete_category')
+    end_flow(user_id, 'delete_category')
+
+    if state is None:
+        await query.edit_message_text(FLOW_EXPIRED_MESSAGE)
+    elif query.data.startswith('confirm_delete_') and int(query.data.split('_')[2]) != state.category_id:
+        # Кнопка из старого сообщения: после него пользователь выбрал другую категорию
+        await query.edit_message_text("Это подтверждение устарело. Начните удаление заново.")
+    elif query.data.startswith('confirm_delete_'):
+        cat_id = state.category_id
+        cat_name = state.category_name
+
+        with write_db() as cursor:
+            # Проверяем, что категория принадлежит пользователю
+            cursor.execute("SELECT id FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
+            owned = cursor.fetchone() is not None
+
+            # Удаляем все связанные записи
+            if owned:
+                cursor.execute("DELETE FROM expenses WHERE category_id = ? AND user_id = ?", (cat_id, user_id))
+                if os.path.exists(ARCHIVE_DB_PATH):
+                    cursor.execute(
+                        "DELETE FROM archive.expenses WHERE category_id = ? AND user_id = ?", (cat_id, user_id))
+                cursor.execute("DELETE FROM limits WHERE category_id = ? AND user_id = ?", (cat_id, user_id))
+                cursor.execute("DELETE FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
+
+        if not owned:
             await query.edit_message_text("У вас нет доступа к этой категории.")
-            conn.close()
             return ConversationHandler.END
 
-        # Удаляем все связанные записи
-        cursor.execute("DELETE FROM expenses WHERE category_id = ? AND user_id = ?", (cat_id, user_id))
-        cursor.execute("DELETE FROM limits WHERE category_id = ? AND user_id = ?", (cat_id, user_id))
-        cursor.execute("DELETE FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-
-        conn.commit()
-        conn.close()
+        invalidate_category_index(user_id)
+        bump_data_version(user_id)
 
         await query.edit_message_text(f"Категория '{cat_name}' и все связанные данные удалены.")
     else:
@@ -504,6 +1474,10 @@ async def delete_category_finish(update: Update, context: ContextTypes.DEFAULT_T
 
 # Команда для управления лимитами
 async def limits_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if context.args and context.args[0] == 'copy':
+        await copy_limits(update, context)
+        return
+
     keyboard = [
         [InlineKeyboardButton("Установить лимит", callback_data='set_limit')],
         [InlineKeyboardButton("Изменить лимит", callback_data='edit_limit')]
@@ -512,6 +1486,33 @@ async def limits_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text('Управление лимитами расходов:', reply_markup=reply_markup)
 
 
+# Команда /limits copy: перенести лимиты прошлого месяца на текущий
+async def copy_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = get_user_id(update)
+    period = current_period(user_id)
+    previous = period.previous()
+
+    with write_db() as cursor:
+        cursor.execute("""
+            INSERT OR IGNORE INTO limits (category_id, user_id, amount, month, year)
+            SELECT category_id, user_id, amount, ?, ? FROM limits
+            WHERE category_id IN (SELECT id FROM categories WHERE user_id = ?)
+              AND month = ? AND year = ? AND user_id = ?
+        """, (period.month, period.year, user_id, previous.month, previous.year, user_id))
+        copied = cursor.rowcount
+
+    if not copied:
+        await update.message.reply_text(
+            f"Переносить нечего: лимиты на {previous.month}/{previous.year} не установлены "
+            f"или уже есть на {period.month}/{period.year}.")
+        return
+
+    bump_data_version(user_id)
+    await update.message.reply_text(
+        f"Перенесено лимитов с {previous.month}/{previous.year} на {period.month}/{period.year}: {copied}.\n"
+        "Лимиты, которые уже были установлены на этот месяц, не изменены.")
+
+
 # Начало установки лимита
 async def set_limit_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -539,39 +1540,30 @@ async def set_limit_category(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     cat_id = query.data.split('_')[1]
-    context.user_data['limit_category_id'] = cat_id
-    
     user_id = get_user_id(update)
-    context.user_data['user_id'] = user_id
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-    cat_name_data = cursor.fetchone()
+    cat_name = get_category_name(user_id, cat_id)
     
-    if not cat_name_data:
+    if not cat_name:
         await query.edit_message_text("Категория не найдена или у вас нет доступа к ней.")
-        conn.close()
         return ConversationHandler.END
         
-    cat_name = cat_name_data[0]
-    context.user_data['limit_category_name'] = cat_name
+    start_flow(user_id, 'set_limit', cat_id, cat_name)
 
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+    period = current_period(user_id)
 
-    cursor.execute("""
-        SELECT amount FROM limits 
-        WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
-    """, (cat_id, current_month, current_year, user_id))
+    with read_db() as cursor:
+        cursor.execute("""
+            SELECT amount FROM limits 
+            WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
+        """, (cat_id, period.month, period.year, user_id))
+        limit_data = cursor.fetchone()
 
-    limit_data = cursor.fetchone()
     current_limit = limit_data[0] if limit_data else 0
-    conn.close()
 
     await query.edit_message_text(
         f"Категория: {cat_name}\n"
-        f"Текущий лимит на {current_month}/{current_year}: {format_money(current_limit)}\n\n"
+        f"Текущий лимит на {period.month}/{period.year}: {format_money(current_limit)}\n\n"
         "Введите новый лимит расходов для этой категории:"
     )
     return SET_LIMIT
@@ -580,7 +1572,7 @@ async def set_limit_category(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # Завершение установки лимита
 async def set_limit_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        limit_amount = float(update.message.text.strip())
+        limit_amount = parse_money(update.message.text)
         if limit_amount < 0:
             await update.message.reply_text(
                 "Лимит не может быть отрицательным. Пожалуйста, введите положительное число.")
@@ -589,26 +1581,28 @@ async def set_limit_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, введите корректное число.")
         return SET_LIMIT
 
-    cat_id = context.user_data.get('limit_category_id')
-    cat_name = context.user_data.get('limit_category_name')
-    user_id = context.user_data.get('user_id', get_user_id(update))
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+    user_id = get_user_id(update)
+    state = get_flow(user_id, 'set_limit')
+    end_flow(user_id, 'set_limit')
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
+    if state is None:
+        await update.message.reply_text(FLOW_EXPIRED_MESSAGE)
+        return ConversationHandler.END
 
-    # Пробуем обновить существующий лимит или создать новый
-    cursor.execute("""
-        INSERT OR REPLACE INTO limits (category_id, amount, month, year, user_id)
-        VALUES (?, ?, ?, ?, ?)
-    """, (cat_id, limit_amount, current_month, current_year, user_id))
+    cat_id = state.category_id
+    cat_name = state.category_name
+    period = current_period(user_id)
 
-    conn.commit()
-    conn.close()
+    # Пробуем обновить существующий лимит или создать новый
+    with write_db() as cursor:
+        cursor.execute("""
+            INSERT OR REPLACE INTO limits (category_id, amount, month, year, user_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (cat_id, limit_amount, period.month, period.year, user_id))
+    bump_data_version(user_id)
 
     await update.message.reply_text(
-        f"Лимит для категории '{cat_name}' на {current_month}/{current_year} "
+        f"Лимит для категории '{cat_name}' на {period.month}/{period.year} "
         f"установлен: {format_money(limit_amount)}"
     )
 
@@ -639,33 +1633,94 @@ async def add_expense_category(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     cat_id = query.data.split('_')[1]
-    context.user_data['expense_category_id'] = cat_id
-    
     user_id = get_user_id(update)
-    context.user_data['user_id'] = user_id
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM categories WHERE id = ? AND user_id = ?", (cat_id, user_id))
-    cat_name_data = cursor.fetchone()
+    cat_name = get_category_name(user_id, cat_id)
     
-    if not cat_name_data:
+    if not cat_name:
         await query.edit_message_text("Категория не найдена или у вас нет доступа к ней.")
-        conn.close()
         return ConversationHandler.END
         
-    cat_name = cat_name_data[0]
-    context.user_data['expense_category_name'] = cat_name
-    conn.close()
+    start_flow(user_id, 'add_expense', cat_id, cat_name)
 
-    await query.edit_message_text(f"Категория: {cat_name}\nВведите сумму расхода:")
+    await query.edit_message_text(
+        f"Категория: {cat_name}\n"
+        "Введите сумму расхода и, если нужно, комментарий через пробел.\n"
+        "Например: 350 аптека аспирин"
+    )
     return EXPENSE_AMOUNT
 
 
+# Запись расхода в БД, возвращает лимит и сумму расходов категории за текущий месяц
+def record_expense(user_id, cat_id, expense_amount, note=None):
+    period = current_period(user_id)
+
+    with write_db() as cursor:
+        # Добавляем расход
+        cursor.execute("""
+            INSERT INTO expenses (category_id, amount, date, user_id, note)
+            VALUES (?, ?, ?, ?, ?)
+        """, (cat_id, expense_amount, period.today.isoformat(), user_id, note))
+
+        # Получаем текущий лимит и расходы
+        cursor.execute("""
+            SELECT amount FROM limits 
+            WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
+        """, (cat_id, period.month, period.year, user_id))
+
+        limit_data = cursor.fetchone()
+        limit_amount = limit_data[0] if limit_data else 0
+
+        # Получаем сумму расходов по категории за текущий месяц
+        cursor.execute("""
+            SELECT SUM(amount) FROM expenses 
+            WHERE user_id = ? AND category_id = ? AND date >= ? AND date < ?
+        """, (user_id, cat_id, period.start, period.end))
+
+        spent_data = cursor.fetchone()
+        spent_amount = spent_data[0] if spent_data[0] else 0
+
+    bump_data_version(user_id)
+    return limit_amount, spent_amount
+
+
+# Текст ответа после записи расхода
+def expense_message(cat_name, expense_amount, limit_amount, spent_amount, note=None):
+    # Вычисляем остаток
+    remaining = limit_amount - spent_amount
+    note_line = f"Комментарий: {note}\n" if note else ""
+
+    if remaining >= 0:
+        return (
+            f"✅ Расход записан. Категория '{cat_name}'\n"
+            f"Потрачено: {format_money(expense_amount)}\n"
+            f"{note_line}"
+            f"Осталось до лимита: {format_money(remaining)}"
+        )
+    return (
+        f"❌ Расход записан. Категория '{cat_name}'\n"
+        f"Потрачено: {format_money(expense_amount)}\n"
+        f"{note_line}"
+        f"Внимание! Перерасход: {format_money(abs(remaining))}"
+    )
+
+
 # Завершение добавления расхода
 async def add_expense_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Первое слово — сумма, остальное — необязательный комментарий
+    amount_text, _, note = update.message.text.strip().partition(' ')
+    note = ' '.join(note.split()) or None
+
+    # "1 000" — скорее сумма с разделителем тысяч, чем 1 рубль с комментарием "000",
+    # а "350 2 пачки" — обычный комментарий
+    next_word = note.split(' ', 1)[0] if note else ''
+    if len(next_word) == 3 and next_word.isdecimal():
+        await update.message.reply_text(
+            "Похоже, сумма записана с пробелом. Введите её без пробелов, например 1000.")
+        return EXPENSE_AMOUNT
+
     try:
-        expense_amount = float(update.message.text.strip())
+        expense_amount = parse_money(amount_text)
         if expense_amount <= 0:
             await update.message.reply_text(
                 "Сумма расхода должна быть положительным числом. Пожалуйста, введите корректное значение.")
@@ -674,107 +1729,129 @@ async def add_expense_finish(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Пожалуйста, введите корректное число.")
         return EXPENSE_AMOUNT
 
-    cat_id = context.user_data.get('expense_category_id')
-    cat_name = context.user_data.get('expense_category_name')
-    user_id = context.user_data.get('user_id', get_user_id(update))
-    today = datetime.now().date().isoformat()
+    user_id = get_user_id(update)
+    state = get_flow(user_id, 'add_expense')
+    end_flow(user_id, 'add_expense')
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
+    if state is None:
+        await update.message.reply_text(FLOW_EXPIRED_MESSAGE)
+        return ConversationHandler.END
 
-    # Добавляем расход
-    cursor.execute("""
-        INSERT INTO expenses (category_id, amount, date, user_id)
-        VALUES (?, ?, ?, ?)
-    """, (cat_id, expense_amount, today, user_id))
+    cat_id = state.category_id
+    cat_name = state.category_name
 
-    # Получаем текущий лимит и расходы
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+    limit_amount, spent_amount = record_expense(user_id, cat_id, expense_amount, note)
 
-    cursor.execute("""
-        SELECT amount FROM limits 
-        WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
-    """, (cat_id, current_month, current_year, user_id))
+    await update.message.reply_text(expense_message(cat_name, expense_amount, limit_amount, spent_amount, note))
+    return ConversationHandler.END
 
-    limit_data = cursor.fetchone()
-    limit_amount = limit_data[0] if limit_data else 0
 
-    # Получаем сумму расходов по категории за текущий месяц
-    cursor.execute("""
-        SELECT SUM(amount) FROM expenses 
-        WHERE category_id = ? AND strftime('%m', date) = ? AND strftime('%Y', date) = ? AND user_id = ?
-    """, (cat_id, f"{current_month:02d}", str(current_year), user_id))
+# Быстрое добавление расхода одной командой: /e <категория> <сумма>
+async def quick_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) < 2:
+        await update.message.reply_text(
+            "Использование: /e <категория> <сумма>\n"
+            "Категорию можно указать началом названия, опечатки допускаются.")
+        return
 
-    spent_data = cursor.fetchone()
-    spent_amount = spent_data[0] if spent_data[0] else 0
+    try:
+        expense_amount = parse_money(context.args[-1])
+        if expense_amount <= 0:
+            await update.message.reply_text(
+                "Сумма расхода должна быть положительным числом. Пожалуйста, введите корректное значение.")
+            return
+    except ValueError:
+        await update.message.reply_text("Пожалуйста, введите корректное число.")
+        return
 
-    conn.commit()
-    conn.close()
+    user_id = get_user_id(update)
+    category_query = ' '.join(context.args[:-1])
+    candidates = get_category_index(user_id).match(category_query)
 
-    # Вычисляем остаток
-    remaining = limit_amount - spent_amount
+    if not candidates:
+        await update.message.reply_text(f"Категория '{category_query}' не найдена.")
+        return
 
-    if remaining >= 0:
-        message = (
-            f"✅ Расход записан. Категория '{cat_name}'\n"
-            f"Потрачено: {format_money(expense_amount)}\n"
-            f"Осталось до лимита: {format_money(remaining)}"
-        )
-    else:
-        message = (
-            f"❌ Расход записан. Категория '{cat_name}'\n"
-            f"Потрачено: {format_money(expense_amount)}\n"
-            f"Внимание! Перерасход: {format_money(abs(remaining))}"
+    if len(candidates) > 1:
+        keyboard = []
+        for cat_id, cat_name in candidates[:QUICK_EXPENSE_MAX_CANDIDATES]:
+            keyboard.append([InlineKeyboardButton(cat_name, callback_data=f'quick_{cat_id}_{expense_amount}')])
+
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.message.reply_text(
+            f"Найдено несколько категорий по запросу '{category_query}'. Выберите нужную:",
+            reply_markup=reply_markup
         )
+        return
 
-    await update.message.reply_text(message)
-    return ConversationHandler.END
+    cat_id, cat_name = candidates[0]
+    limit_amount, spent_amount = record_expense(user_id, cat_id, expense_amount)
+    await update.message.reply_text(expense_message(cat_name, expense_amount, limit_amount, spent_amount))
 
 
-# Отчет по расходам
-async def show_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    user_id = get_user_id(update)
+# Выбор категории, если быстрый ввод оказался неоднозначным
+async def quick_expense_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
 
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
+    _, cat_id, amount = query.data.split('_')
+    expense_amount = int(amount)
+    user_id = get_user_id(update)
 
-    # Получаем все категории пользователя
-    cursor.execute("SELECT id, name FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
-    categories = cursor.fetchall()
+    cat_name = get_category_name(user_id, cat_id)
 
-    if not categories:
-        await update.message.reply_text("У вас еще нет категорий для отчета.")
-        conn.close()
+    if not cat_name:
+        await query.edit_message_text("Категория не найдена или у вас нет доступа к ней.")
         return
 
-    report = f"📊 Отчет за {current_month}/{current_year}:\n\n"
-    total_limit = 0
-    total_spent = 0
+    limit_amount, spent_amount = record_expense(user_id, cat_id, expense_amount)
+    await query.edit_message_text(expense_message(cat_name, expense_amount, limit_amount, spent_amount))
 
-    for cat_id, cat_name in categories:
-        # Получаем лимит
-        cursor.execute("""
-            SELECT amount FROM limits 
-            WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
-        """, (cat_id, current_month, current_year, user_id))
 
-        limit_data = cursor.fetchone()
-        limit_amount = limit_data[0] if limit_data else 0
-        total_limit += limit_amount
+# Отрисовка отчета по расходам за месяц
+def render_report(user_id, period, expenses_table):
+    with read_db() as cursor:
+        # Получаем все категории пользователя
+        cursor.execute("SELECT id, name FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
+        categories = cursor.fetchall()
 
-        # Получаем расходы
-        cursor.execute("""
-            SELECT SUM(amount) FROM expenses 
-            WHERE category_id = ? AND strftime('%m', date) = ? AND strftime('%Y', date) = ? AND user_id = ?
-        """, (cat_id, f"{current_month:02d}", str(current_year), user_id))
+        total_limit = 0
+        total_spent = 0
+        rows = []
 
-        spent_data = cursor.fetchone()
-        spent_amount = spent_data[0] if spent_data[0] else 0
-        total_spent += spent_amount
+        for cat_id, cat_name in categories:
+            # Получаем лимит
+            cursor.execute("""
+                SELECT amount FROM limits 
+                WHERE category_id = ? AND month = ? AND year = ? AND user_id = ?
+            """, (cat_id, period.month, period.year, user_id))
+
+            limit_data = cursor.fetchone()
+            limit_amount = limit_data[0] if limit_data else 0
+            total_limit += limit_amount
 
+            # Получаем расходы
+            cursor.execute(f"""
+                SELECT SUM(amount) FROM {expenses_table} 
+                WHERE user_id = ? AND category_id = ? AND date >= ? AND date < ?
+            """, (user_id, cat_id, period.start, period.end))
+
+            spent_data = cursor.fetchone()
+            spent_amount = spent_data[0] if spent_data[0] else 0
+            total_spent += spent_amount
+
+            rows.append((cat_name, limit_amount, spent_amount))
+
+    if not categories:
+        return ["У вас еще нет категорий для отчета."]
+
+    lines = [f"📊 Отчет за {period.month}/{period.year}:", ""]
+
+    # Форматируем все суммы отчета за один проход
+    limits_text = format_money_many([limit_amount for _, limit_amount, _ in rows])
+    spent_text = format_money_many([spent_amount for _, _, spent_amount in rows])
+
+    for (cat_name, limit_amount, spent_amount), limit_text, spent_amount_text in zip(rows, limits_text, spent_text):
         # Вычисляем процент использования лимита
         if limit_amount > 0:
             usage_percent = (spent_amount / limit_amount) * 100
@@ -783,9 +1860,10 @@ async def show_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
             usage_percent = 0
             status = "⚠️"
 
-        report += f"{status} {cat_name}:\n"
-        report += f"   Лимит: {format_money(limit_amount)}\n"
-        report += f"   Потрачено: {format_money(spent_amount)} ({usage_percent:.1f}%)\n\n"
+        lines.append(f"{status} {cat_name}:")
+        lines.append(f"   Лимит: {limit_text}")
+        lines.append(f"   Потрачено: {spent_amount_text} ({usage_percent:.1f}%)")
+        lines.append("")
 
     # Общая статистика
     if total_limit > 0:
@@ -795,18 +1873,243 @@ async def show_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         total_percent = 0
         total_status = "⚠️"
 
-    report += f"ИТОГО {total_status}:\n"
-    report += f"Общий лимит: {format_money(total_limit)}\n"
-    report += f"Общие расходы: {format_money(total_spent)} ({total_percent:.1f}%)"
+    total_limit_text, total_spent_text = format_money_many((total_limit, total_spent))
+    lines.append(f"ИТОГО {total_status}:")
+    lines.append(f"Общий лимит: {total_limit_text}")
+    lines.append(f"Общие расходы: {total_spent_text} ({total_percent:.1f}%)")
 
-    conn.close()
-    await update.message.reply_text(report)
+    return split_message(lines)
 
 
-# Функция отмены диалога
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Действие отменено.")
-    return ConversationHandler.END
+# Отчет по расходам
+async def show_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = get_user_id(update)
+    current = current_period(user_id)
+
+    # Можно запросить отчет за прошлый месяц: /report 3/2024
+    period = current
+    if context.args:
+        try:
+            report_month, report_year = (int(part) for part in context.args[0].split('/'))
+            if not 1 <= report_month <= 12 or not 1 <= report_year <= 9999:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text("Укажите месяц в формате ММ/ГГГГ, например: /report 3/2024")
+            return
+        period = Period(report_year, report_month)
+
+    # Расходы за прошлые месяцы могут находиться в архиве
+    if (period.year, period.month) == (current.year, current.month):
+        expenses_table = 'expenses'
+    else:
+        expenses_table = 'all_expenses'
+
+    messages = cached_render(
+        user_id, 'report', period.year, period.month,
+        lambda: render_report(user_id, period, expenses_table)
+    )
+    for message in messages:
+        await update.message.reply_text(message)
+
+
+# Команда /timezone [часовой пояс]
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = get_user_id(update)
+
+    if not context.args:
+        tz = get_user_timezone(user_id)
+        await update.message.reply_text(
+            f"Ваш часовой пояс: {tz.zone}, сейчас {datetime.now(tz):%d.%m.%Y %H:%M}.\n"
+            "Расходы записываются на дату и месяц в этом поясе.\n\n"
+            "Чтобы изменить: /timezone <пояс>, например /timezone Asia/Yekaterinburg"
+        )
+        return
+
+    try:
+        tz = pytz.timezone(context.args[0])
+    except pytz.UnknownTimeZoneError:
+        await update.message.reply_text(
+            f"Неизвестный часовой пояс '{context.args[0]}'. "
+            "Укажите его в формате Регион/Город, например Europe/Moscow или Asia/Novosibirsk.")
+        return
+
+    set_user_timezone(user_id, tz.zone)
+    await update.message.reply_text(
+        f"Часовой пояс установлен: {tz.zone}, сейчас {datetime.now(tz):%d.%m.%Y %H:%M}.")
+
+
+# Сколько расходов показывать на одной странице поиска
+SEARCH_PAGE_SIZE = 10
+
+# Сколько категорий показывать в итогах поиска
+SEARCH_TOP_CATEGORIES = 10
+
+# Сколько символов комментария показывать в результатах
+SEARCH_NOTE_PREVIEW = 100
+
+# Найденные расходы одного источника (основная БД или архив). CROSS JOIN
+# фиксирует порядок: сначала индекс комментариев, потом расходы по rowid,
+# иначе планировщик перебирает все расходы пользователя и ищет по каждому
+SEARCH_SOURCE = '''
+    SELECT e.id, e.category_id, e.amount, e.date, e.note
+    FROM {schema}.expenses_fts f
+    CROSS JOIN {schema}.expenses e ON e.id = f.rowid
+    WHERE f.expenses_fts MATCH :match AND e.user_id = :user_id
+'''
+
+
+# Поисковое выражение FTS5: каждое слово ищется как префикс, все слова обязательны
+def build_search_match(user_id, terms):
+    words = ' '.join('"' + word.replace('"', '""') + '"*' for word in terms.split())
+    return f'user_id : "{user_id}" AND note : ({words})'
+
+
+# Поиск расходов по комментарию
+def search_expenses(user_id, terms, offset):
+    """
+    Одним запросом возвращает страницу найденных расходов и итоги по категориям:
+    (список (id, category_id, amount, date, note), {category_id: (сумма, количество)})
+    """
+    sources = [SEARCH_SOURCE.format(schema='main')]
+    if os.path.exists(ARCHIVE_DB_PATH):
+        sources.append(SEARCH_SOURCE.format(schema='archive'))
+
+    with read_db() as cursor:
+        cursor.execute(f'''
+            WITH matches AS MATERIALIZED ({' UNION ALL '.join(sources)})
+            SELECT * FROM (
+                SELECT 0, id, category_id, amount, date, note FROM matches
+                ORDER BY date DESC, id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            UNION ALL
+            SELECT 1, NULL, category_id, SUM(amount), NULL, COUNT(*) FROM matches GROUP BY category_id
+        ''', {
+            'match': build_search_match(user_id, terms),
+            'user_id': user_id,
+            'limit': SEARCH_PAGE_SIZE,
+            'offset': offset,
+        })
+        rows = cursor.fetchall()
+
+    page = [row[1:] for row in rows if row[0] == 0]
+    totals = {row[2]: (row[3], row[5]) for row in rows if row[0] == 1}
+    return page, totals
+
+
+# Отрисовка страницы результатов поиска с кнопками перелистывания
+def render_search(user_id, terms, offset):
+    try:
+        page, totals = search_expenses(user_id, terms, offset)
+    except sqlite3.OperationalError:
+        # Запрос, из которого FTS5 не смог выделить ни одного слова
+        return split_message([f"Не удалось разобрать запрос '{terms}'."]), None
+
+    if not totals:
+        return split_message([f"По запросу '{terms}' ничего не найдено."]), None
+
+    category_names = dict(get_categories(user_id))
+    found_count = sum(count for _, count in totals.values())
+    found_amount = sum(amount for amount, _ in totals.values())
+    by_amount = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    top = by_amount[:SEARCH_TOP_CATEGORIES]
+
+    money = format_money_many(
+        [found_amount] + [amount for _, (amount, _) in top] + [amount for _, _, amount, _, _ in page])
+    found_amount_text, top_text, page_text = money[0], money[1:len(top) + 1], money[len(top) + 1:]
+
+    lines = [f"🔎 По запросу '{terms}' найдено расходов: {found_count} на сумму {found_amount_text}", ""]
+    for (cat_id, (_, count)), amount_text in zip(top, top_text):
+        lines.append(f"{category_names.get(cat_id, '?')}: {amount_text} ({count})")
+    if len(by_amount) > len(top):
+        lines.append(f"...и еще категорий: {len(by_amount) - len(top)}")
+
+    lines.append("")
+    for (_, cat_id, _, date, note), amount_text in zip(page, page_text):
+        if len(note) > SEARCH_NOTE_PREVIEW:
+            note = note[:SEARCH_NOTE_PREVIEW] + "…"
+        lines.append(f"{date} {category_names.get(cat_id, '?')}: {amount_text} — {note}")
+
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f'search_{max(offset - SEARCH_PAGE_SIZE, 0)}'))
+    if offset + SEARCH_PAGE_SIZE < found_count:
+        buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f'search_{offset + SEARCH_PAGE_SIZE}'))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+
+    return split_message(lines), reply_markup
+
+
+# Команда /search <слова>
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    terms = ' '.join(context.args)
+    if not terms:
+        await update.message.reply_text(
+            "Использование: /search <слова из комментария>\nНапример: /search аптека")
+        return
+
+    user_id = get_user_id(update)
+    state = SearchState(terms)
+    search_states[user_id] = state
+
+    # Поиск по большой истории идет секунды, поэтому не в цикле событий
+    messages, reply_markup = await asyncio.to_thread(render_search, user_id, terms, 0)
+    # Кнопки перелистывания — под последней частью страницы
+    for message in messages[:-1]:
+        await update.message.reply_text(message)
+    sent = await update.message.reply_text(messages[-1], reply_markup=reply_markup)
+    state.message_id = sent.message_id
+
+
+# Перелистывание результатов поиска
+async def search_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+
+    user_id = get_user_id(update)
+    state = search_states.get(user_id)
+    if state is None or state.expires_at < time.monotonic():
+        await query.answer()
+        await query.edit_message_text(FLOW_EXPIRED_MESSAGE)
+        return
+
+    # Помнится только последний запрос, кнопки под старыми результатами листали бы его
+    if query.message.message_id != state.message_id:
+        await query.answer("Эти результаты устарели. Повторите поиск.")
+        return
+    await query.answer()
+
+    offset = int(query.data.split('_')[1])
+    messages, reply_markup = await asyncio.to_thread(render_search, user_id, state.terms, offset)
+    # Первая часть заменяет сообщение с кнопками, остальные приходят отдельно,
+    # кнопки остаются под последней частью
+    if len(messages) == 1:
+        await query.edit_message_text(messages[0], reply_markup=reply_markup)
+        return
+    await query.edit_message_text(messages[0])
+    for message in messages[1:-1]:
+        await query.message.reply_text(message)
+    sent = await query.message.reply_text(messages[-1], reply_markup=reply_markup)
+    state.message_id = sent.message_id
+
+
+# Обработчик отмены диалога flow, остальные диалоги пользователя не затрагивает
+def cancel(flow):
+    async def cancel_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        end_flow(get_user_id(update), flow)
+        await update.message.reply_text("Действие отменено.")
+        return ConversationHandler.END
+    return cancel_flow
+
+
+# Адрес Bot API, к которому дописывается токен. Переопределяется, чтобы
+# направить бота на локальный сервер, например на стенд loadtest.py
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "https://api.telegram.org/bot")
+
+# Внешний адрес вебхука. Если не задан, бот получает обновления через getUpdates
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
 
 
 # Главная функция
@@ -820,11 +2123,12 @@ def main():
         raise ValueError("Не найден токен бота! Убедитесь, что TGbotTOKEN указан в файле .env")
 
     # Создаем экземпляр приложения
-    application = Application.builder().token(bot_token).build()
+    application = Application.builder().token(bot_token).base_url(BOT_API_BASE_URL).build()
 
     # Добавляем обработчики основных команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("report", show_report))
+    application.add_handler(CommandHandler("timezone", timezone_command))
 
     # Обработчик для категорий
     application.add_handler(CommandHandler("categories", categories_menu))
@@ -833,9 +2137,11 @@ def main():
     add_category_conv = ConversationHandler(
         entry_points=[CallbackQueryHandler(add_category_start, pattern='^add_category$')],
         states={
-            CATEGORY_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_category_finish)]
+            CATEGORY_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_category_finish)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, flow_timeout('add_category'))]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel('add_category'))],
+        conversation_timeout=FLOW_TTL_SECONDS
     )
     application.add_handler(add_category_conv)
 
@@ -844,11 +2150,13 @@ def main():
         entry_points=[CallbackQueryHandler(edit_category_start, pattern='^edit_category$')],
         states={
             CATEGORY_EDIT: [
-                CallbackQueryHandler(edit_category_select, pattern='^edit_\d+$'),
+                CallbackQueryHandler(edit_category_select, pattern=r'^edit_\d+$'),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, edit_category_finish)
-            ]
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, flow_timeout('edit_category'))]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel('edit_category'))],
+        conversation_timeout=FLOW_TTL_SECONDS
     )
     application.add_handler(edit_category_conv)
 
@@ -857,11 +2165,13 @@ def main():
         entry_points=[CallbackQueryHandler(delete_category_start, pattern='^delete_category$')],
         states={
             CATEGORY_DELETE: [
-                CallbackQueryHandler(delete_category_confirm, pattern='^delete_\d+$'),
-                CallbackQueryHandler(delete_category_finish, pattern='^confirm_delete_\d+$|^cancel_delete$')
-            ]
+                CallbackQueryHandler(delete_category_confirm, pattern=r'^delete_\d+$'),
+                CallbackQueryHandler(delete_category_finish, pattern=r'^confirm_delete_\d+$|^cancel_delete$')
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, flow_timeout('delete_category'))]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel('delete_category'))],
+        conversation_timeout=FLOW_TTL_SECONDS
     )
     application.add_handler(delete_category_conv)
 
@@ -873,11 +2183,13 @@ def main():
         entry_points=[CallbackQueryHandler(set_limit_start, pattern='^set_limit$')],
         states={
             SET_LIMIT: [
-                CallbackQueryHandler(set_limit_category, pattern='^setlimit_\d+$'),
+                CallbackQueryHandler(set_limit_category, pattern=r'^setlimit_\d+$'),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, set_limit_finish)
-            ]
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, flow_timeout('set_limit'))]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel('set_limit'))],
+        conversation_timeout=FLOW_TTL_SECONDS
     )
     application.add_handler(set_limit_conv)
 
@@ -885,19 +2197,75 @@ def main():
     add_expense_conv = ConversationHandler(
         entry_points=[CommandHandler("expense", add_expense_start)],
         states={
-            ADD_EXPENSE: [CallbackQueryHandler(add_expense_category, pattern='^expense_\d+$')],
-            EXPENSE_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_finish)]
+            ADD_EXPENSE: [CallbackQueryHandler(add_expense_category, pattern=r'^expense_\d+$')],
+            EXPENSE_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_finish)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, flow_timeout('add_expense'))]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel('add_expense'))],
+        conversation_timeout=FLOW_TTL_SECONDS
     )
     application.add_handler(add_expense_conv)
 
+    # Быстрое добавление расхода одной командой
+    application.add_handler(CommandHandler("e", quick_expense))
+    application.add_handler(CallbackQueryHandler(quick_expense_select, pattern=r'^quick_\d+_\d+$'))
+
     # Обработчик для отображения списка категорий
     application.add_handler(CallbackQueryHandler(list_categories, pattern='^list_categories$'))
 
+    # Поиск расходов по комментарию
+    application.add_handler(CommandHandler("search", search))
+    application.add_handler(CallbackQueryHandler(search_page, pattern=r'^search_\d+$'))
+
+    # Очистка брошенных диалогов
+    application.job_queue.run_repeating(sweep_flows_job, interval=60)
+
+    # Резервное копирование БД по расписанию
+    if BACKUP_INTERVAL_HOURS > 0:
+        application.job_queue.run_repeating(
+            backup_job,
+            interval=timedelta(hours=BACKUP_INTERVAL_HOURS),
+            first=timedelta(minutes=1)
+        )
+
+    # Перенос старых расходов в архив по расписанию
+    if ARCHIVE_AFTER_MONTHS > 0:
+        application.job_queue.run_repeating(
+            archive_job,
+            interval=timedelta(hours=ARCHIVE_INTERVAL_HOURS),
+            first=timedelta(minutes=5)
+        )
+
+    # Перенос лимитов на новый месяц по расписанию
+    if LIMITS_CARRY_FORWARD:
+        application.job_queue.run_repeating(
+            carry_forward_limits_job,
+            interval=timedelta(minutes=LIMITS_CARRY_FORWARD_INTERVAL_MINUTES),
+            first=timedelta(seconds=30)
+        )
+
     # Запуск бота
-    application.run_polling()
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlsplit(WEBHOOK_URL).path.lstrip('/'),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
-    main()
+    # python main.py --rebuild-search-index перестраивает индекс комментариев и завершается
+    if sys.argv[1:] == ['--rebuild-search-index']:
+        init_db()
+        rebuild_search_index()
+    # python main.py --vacuum освобождает место в старой БД и переводит её
+    # в инкрементальный режим; бот на это время нужно остановить
+    elif sys.argv[1:] == ['--vacuum']:
+        init_db()
+        vacuum_db()
+    else:
+        main()
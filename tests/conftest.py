@@ -0,0 +1,36 @@
+import os
+import queue
+import sys
+
+import pytest
+
+# Тесты импортируют main.py из корня репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+# Пустая БД во временном каталоге вместо рабочей
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "expenses.db")
+    monkeypatch.setattr(main, "DB_PATH", path)
+    monkeypatch.setattr(main, "DB_CREATE", True)
+    monkeypatch.setattr(main, "ARCHIVE_DB_PATH", str(tmp_path / "expenses_archive.db"))
+    monkeypatch.setattr(main, "ARCHIVE_AFTER_MONTHS", 0)
+    return path
+
+
+# Инициализированная БД со своими соединениями и пустыми кэшами
+@pytest.fixture
+def db(db_path, monkeypatch):
+    monkeypatch.setattr(main, "writer_connection", None)
+    monkeypatch.setattr(main, "read_pool", queue.LifoQueue())
+    monkeypatch.setattr(main, "user_timezones", {})
+    main.init_db()
+    yield db_path
+
+    if main.writer_connection is not None:
+        main.writer_connection.close()
+    while not main.read_pool.empty():
+        main.read_pool.get_nowait().close()
@@ -0,0 +1,27 @@
+import os
+
+import main
+from main import archive_expenses, init_db, read_db, write_db
+
+
+def test_archive_returns_free_pages(db, monkeypatch):
+    monkeypatch.setattr(main, "ARCHIVE_AFTER_MONTHS", 1)
+    monkeypatch.setattr(main, "ARCHIVE_CHUNK_PAUSE", 0)
+    # Несколько порций, чтобы проверить цикл, а не один шаг
+    monkeypatch.setattr(main, "ARCHIVE_VACUUM_PAGES", 10)
+    init_db()
+
+    with write_db() as cursor:
+        cursor.execute("INSERT INTO categories (id, name, user_id) VALUES (1, 'Еда', 1)")
+        cursor.executemany(
+            "INSERT INTO expenses (category_id, user_id, amount, date, note) VALUES (1, 1, 100, ?, ?)",
+            [('2020-01-01', 'x' * 500)] * 2000 + [('2099-01-01', None)]
+        )
+
+    assert archive_expenses() == 2000
+
+    with read_db() as cursor:
+        assert cursor.execute("PRAGMA main.freelist_count").fetchone() == (0,)
+        assert cursor.execute("SELECT COUNT(*) FROM main.expenses").fetchone() == (1,)
+        assert cursor.execute("SELECT COUNT(*) FROM archive.expenses").fetchone() == (2000,)
+    assert os.path.exists(main.ARCHIVE_DB_PATH)
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import main
+from main import backup_db, write_db
+
+# Целые копии, сделанные раньше
+OLD_SNAPSHOTS = ["expenses-20200101-000000.db.gz", "expenses-20200102-000000.db.gz"]
+
+
+@pytest.fixture
+def backups(db, tmp_path, monkeypatch):
+    backup_dir = tmp_path / "backups"
+    backup_dir.mkdir()
+    for name in OLD_SNAPSHOTS:
+        (backup_dir / name).write_bytes(b"old")
+    monkeypatch.setattr(main, "BACKUP_DIR", str(backup_dir))
+    monkeypatch.setattr(main, "BACKUP_KEEP", 2)
+    monkeypatch.setattr(main, "BACKUP_GZIP", True)
+    monkeypatch.setattr(main, "BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr(main, "BACKUP_STEP_PAUSE", 0)
+    with write_db() as cursor:
+        cursor.executemany("INSERT INTO categories (name, user_id) VALUES (?, 1)", [(f"к{i}",) for i in range(200)])
+    return backup_dir
+
+
+def test_backup_rotates(backups):
+    [snapshot_path] = backup_db()
+    assert snapshot_path.endswith(".db.gz")
+    assert sorted(os.listdir(backups)) == [OLD_SNAPSHOTS[1], os.path.basename(snapshot_path)]
+
+
+def test_failed_copy_is_removed(backups, monkeypatch):
+    def fail(seconds):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(main.time, "sleep", fail)
+
+    with pytest.raises(OSError):
+        backup_db()
+    assert sorted(os.listdir(backups)) == OLD_SNAPSHOTS
+
+
+def test_failed_compression_is_removed(backups, monkeypatch):
+    def fail(source, target, length):
+        target.write(source.read(100))
+        raise OSError("No space left on device")
+    monkeypatch.setattr(main.shutil, "copyfileobj", fail)
+
+    with pytest.raises(OSError):
+        backup_db()
+    assert sorted(os.listdir(backups)) == OLD_SNAPSHOTS
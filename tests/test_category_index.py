@@ -0,0 +1,72 @@
+import pytest
+
+import main
+from main import CategoryIndex, get_category_index, invalidate_category_index
+
+CATEGORIES = [
+    (1, 'Кафе'), (2, 'кафе'), (3, 'Кафетерий'), (4, 'Продукты'), (5, 'Такси'),
+    (6, 'Транспорт'), (7, 'Аптека'), (8, 'Коммунальные услуги'), (9, 'Театр'),
+]
+
+
+@pytest.fixture
+def index():
+    return CategoryIndex(CATEGORIES)
+
+
+@pytest.mark.parametrize("query, found", [
+    # Точное совпадение, пробелы по краям не важны
+    ("Продукты", [(4, 'Продукты')]),
+    ("аптека ", [(7, 'Аптека')]),
+    # Названия, различающиеся только регистром: сначала то, что совпадает буквально
+    ("Кафе", [(1, 'Кафе')]),
+    ("кафе", [(2, 'кафе')]),
+    ("КАФЕ", [(1, 'Кафе'), (2, 'кафе')]),
+    # Начало названия
+    ("Прод", [(4, 'Продукты')]),
+    ("кафет", [(3, 'Кафетерий')]),
+    ("т", [(5, 'Такси'), (9, 'Театр'), (6, 'Транспорт')]),
+    # Одна опечатка в коротком запросе, две — в длинном
+    ("ткси", [(5, 'Такси')]),
+    ("трнспорт", [(6, 'Транспорт')]),
+    ("транспотр", [(6, 'Транспорт')]),
+    ("комунальные услги", [(8, 'Коммунальные услуги')]),
+    # Перестановка — две правки, в коротком запросе это слишком много
+    ("таски", []),
+    ("xyz", []),
+    ("", []),
+    ("   ", []),
+])
+def test_match(index, query, found):
+    assert index.match(query) == found
+
+
+def test_typo_prefers_whole_name():
+    # "кофе" на одну правку от "Кафе" и от начала "Кафетерий"
+    assert CategoryIndex([(1, 'Кафе'), (2, 'Кафетерий')]).match("кофе") == [(1, 'Кафе')]
+
+
+def test_ambiguous_typo():
+    assert CategoryIndex([(1, 'Кино'), (2, 'Вино')]).match("лино") == [(2, 'Вино'), (1, 'Кино')]
+
+
+def test_index_cache_is_bounded(monkeypatch):
+    built = []
+    monkeypatch.setattr(main, "CATEGORY_INDEX_CACHE_SIZE", 2)
+    monkeypatch.setattr(main, "category_indexes", main.OrderedDict())
+    monkeypatch.setattr(main, "get_categories", lambda user_id: built.append(user_id) or [(user_id, 'Еда')])
+
+    first = get_category_index(1)
+    get_category_index(2)
+    # Обращение к 1 делает его самым свежим, вытесняется 2
+    assert get_category_index(1) is first
+    get_category_index(3)
+    assert list(main.category_indexes) == [1, 3]
+
+    # Вытесненный индекс строится заново
+    get_category_index(2)
+    assert built == [1, 2, 3, 2]
+    assert list(main.category_indexes) == [3, 2]
+
+    invalidate_category_index(3)
+    assert list(main.category_indexes) == [2]
@@ -0,0 +1,71 @@
+import pytest
+
+import main
+from main import SearchState, end_flow, get_flow, start_flow, sweep_flows
+
+
+# Часы, которые тест переводит вручную
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, "monotonic", clock)
+    monkeypatch.setattr(main, "FLOW_TTL_SECONDS", 60)
+    monkeypatch.setattr(main, "flow_states", {})
+    monkeypatch.setattr(main, "search_states", {})
+    return clock
+
+
+def test_flows_are_separate(clock):
+    # Пользователь выбрал категорию для удаления, а затем для расхода
+    start_flow(1, 'delete_category', '10', 'Кафе')
+    start_flow(1, 'add_expense', 20, 'Такси')
+    start_flow(2, 'delete_category', 30, 'Кино')
+
+    state = get_flow(1, 'delete_category')
+    assert (state.category_id, state.category_name) == (10, 'Кафе')
+    assert get_flow(1, 'add_expense').category_id == 20
+    assert get_flow(2, 'delete_category').category_id == 30
+    assert get_flow(2, 'add_expense') is None
+
+    # Завершение одного диалога не трогает другие
+    end_flow(1, 'add_expense')
+    assert get_flow(1, 'add_expense') is None
+    assert get_flow(1, 'delete_category').category_id == 10
+
+
+def test_flow_expires(clock):
+    start_flow(1, 'set_limit', 5, 'Еда')
+    clock.now += 59
+    assert get_flow(1, 'set_limit').category_id == 5
+
+    clock.now += 2
+    assert get_flow(1, 'set_limit') is None
+
+    # Новый выбор категории начинает отсчет заново
+    start_flow(1, 'set_limit', 6, 'Кафе')
+    assert get_flow(1, 'set_limit').category_id == 6
+
+
+def test_sweep_flows(clock):
+    start_flow(1, 'add_expense', 1, 'Еда')
+    main.search_states[1] = SearchState("аптека")
+    clock.now += 30
+    start_flow(2, 'add_expense', 2, 'Кафе')
+
+    assert sweep_flows() == 0
+    clock.now += 31
+    assert sweep_flows() == 2
+    assert list(main.flow_states) == [(2, 'add_expense')]
+    assert main.search_states == {}
+
+    clock.now += 30
+    assert sweep_flows() == 1
+    assert main.flow_states == {}
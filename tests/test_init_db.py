@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+import main
+from main import init_db
+
+
+def test_missing_database_is_an_error(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_CREATE", False)
+    with pytest.raises(FileNotFoundError, match="DB_CREATE=1"):
+        init_db()
+    assert not os.path.exists(db_path)
+
+
+def test_new_database_is_logged(db_path, caplog, monkeypatch):
+    init_db()
+    assert os.path.exists(db_path)
+    assert "создается новая пустая БД" in caplog.text
+
+    # Существующая БД открывается и без DB_CREATE
+    caplog.clear()
+    monkeypatch.setattr(main, "DB_CREATE", False)
+    init_db()
+    assert "создается" not in caplog.text
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import main
+from main import carry_forward_limits, read_db, set_user_timezone, write_db
+
+# 31 октября 2026: во Владивостоке уже ноябрь, в Москве еще октябрь
+VLADIVOSTOK_NOVEMBER = datetime(2026, 10, 31, 14, 30, tzinfo=timezone.utc).timestamp()
+# Ноябрь наступил и в Москве
+MOSCOW_NOVEMBER = datetime(2026, 10, 31, 21, 30, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def limits(db, monkeypatch):
+    monkeypatch.setattr(main, "LIMITS_CHUNK_SIZE", 2)
+    monkeypatch.setattr(main, "LIMITS_CHUNK_PAUSE", 0)
+    monkeypatch.setattr(main, "DEFAULT_TIMEZONE", "Europe/Moscow")
+    set_user_timezone(2, "Asia/Vladivostok")
+    with write_db() as cursor:
+        cursor.executemany(
+            "INSERT INTO categories (id, name, user_id) VALUES (?, ?, ?)",
+            [(1, 'Еда', 1), (2, 'Кафе', 1), (3, 'Такси', 1), (4, 'Еда', 2), (5, 'Кино', 2)]
+        )
+        cursor.executemany(
+            "INSERT INTO limits (category_id, user_id, amount, month, year) VALUES (?, ?, ?, ?, ?)",
+            [(1, 1, 1000, 10, 2026), (2, 1, 2000, 10, 2026), (3, 1, 3000, 9, 2026),
+             (4, 2, 4000, 10, 2026), (5, 2, 5000, 10, 2026),
+             # Лимит на ноябрь, установленный вручную, переносом не меняется
+             (5, 2, 5500, 11, 2026)]
+        )
+
+
+# Лимиты на ноябрь 2026 по category_id
+def november_limits():
+    with read_db() as cursor:
+        cursor.execute("SELECT category_id, amount FROM limits WHERE year = 2026 AND month = 11")
+        return dict(cursor.fetchall())
+
+
+def test_carry_forward_by_zone(limits, monkeypatch):
+    # В Москве еще октябрь: сентябрьский лимит переносится на октябрь
+    monkeypatch.setattr(main.time, "time", lambda: VLADIVOSTOK_NOVEMBER)
+    assert carry_forward_limits() == 2
+    assert november_limits() == {4: 4000, 5: 5500}
+
+    # Сентябрьский лимит попадает на ноябрь только через октябрь
+    monkeypatch.setattr(main.time, "time", lambda: MOSCOW_NOVEMBER)
+    assert carry_forward_limits() == 3
+    assert november_limits() == {1: 1000, 2: 2000, 3: 3000, 4: 4000, 5: 5500}
+
+
+def test_carried_month_survives_restart(limits, monkeypatch):
+    # Сразу ноябрь: сентябрьский лимит не переносится, это не прошлый месяц
+    monkeypatch.setattr(main.time, "time", lambda: MOSCOW_NOVEMBER)
+    assert carry_forward_limits() == 3
+    assert november_limits() == {1: 1000, 2: 2000, 4: 4000, 5: 5500}
+
+    with read_db() as cursor:
+        cursor.execute("SELECT timezone, year, month FROM limits_carried_forward ORDER BY timezone")
+        assert cursor.fetchall() == [("Asia/Vladivostok", 2026, 11), ("Europe/Moscow", 2026, 11)]
+
+    # Месяц отмечен в БД, поэтому повторный запуск не читает лимиты,
+    # даже если пользователь удалил перенесенный лимит
+    with write_db() as cursor:
+        cursor.execute("DELETE FROM limits WHERE category_id = 1 AND month = 11")
+    assert carry_forward_limits() == 0
+    assert 1 not in november_limits()
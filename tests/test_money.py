@@ -0,0 +1,127 @@
+import random
+import sqlite3
+
+import pytest
+
+from main import MAX_AMOUNT, format_money, format_money_many, init_db, parse_money
+
+
+@pytest.mark.parametrize("text, amount", [
+    ("0", 0),
+    ("350", 35000),
+    ("12.34", 1234),
+    ("12,34", 1234),
+    (" 7 ", 700),
+    ("0.1", 10),
+    ("1e3", 100000),
+    ("0.005", 1),
+    ("0.00499", 0),
+    ("-0.005", -1),
+    ("-12,34", -1234),
+])
+def test_parse_money(text, amount):
+    assert parse_money(text) == amount
+
+
+@pytest.mark.parametrize("text", ["", "abc", "1.2.3", "1'234", "nan", "inf", "-inf", "1e20"])
+def test_parse_money_rejects(text):
+    with pytest.raises(ValueError):
+        parse_money(text)
+
+
+@pytest.mark.parametrize("amount, text", [
+    (0, "0,00"),
+    (5, "0,05"),
+    (-5, "-0,05"),
+    (100, "1,00"),
+    (123456, "1'234,56"),
+    (-123456789, "-1'234'567,89"),
+    (MAX_AMOUNT - 1, "9'999'999'999'999,99"),
+])
+def test_format_money(amount, text):
+    assert format_money(amount) == text
+
+
+def test_format_money_many_matches_format_money():
+    amounts = [0, 1, -1, 99, -100, 123456, -10 ** 12]
+    assert format_money_many(amounts) == [format_money(amount) for amount in amounts]
+
+
+def test_format_money_many_empty():
+    assert format_money_many([]) == []
+    assert format_money_many(()) == []
+
+
+def test_round_trip():
+    rng = random.Random(31)
+    amounts = [rng.randrange(-MAX_AMOUNT + 1, MAX_AMOUNT) for _ in range(10000)]
+    amounts += [0, 1, -1, 99, -99, 100, -100, MAX_AMOUNT - 1, -MAX_AMOUNT + 1]
+    for amount, text in zip(amounts, format_money_many(amounts)):
+        assert parse_money(text.replace("'", "")) == amount
+
+
+def test_point_one_plus_point_two():
+    total = parse_money("0.1") + parse_money("0.2")
+    assert total == parse_money("0.3")
+    assert format_money(total) == "0,30"
+
+
+# Схема БД до перехода на копейки
+LEGACY_SCHEMA = '''
+CREATE TABLE categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    user_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(name, user_id)
+);
+CREATE TABLE limits (
+    id INTEGER PRIMARY KEY,
+    category_id INTEGER,
+    user_id INTEGER,
+    amount REAL,
+    month INTEGER,
+    year INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (category_id) REFERENCES categories (id),
+    UNIQUE(category_id, month, year, user_id)
+);
+CREATE TABLE expenses (
+    id INTEGER PRIMARY KEY,
+    category_id INTEGER,
+    user_id INTEGER,
+    amount REAL,
+    date DATE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (category_id) REFERENCES categories (id)
+);
+'''
+
+
+def test_migrate_real_database(db_path):
+    # 1.15 и 0.29 в двоичной записи чуть меньше, чем 115 и 29 копеек после умножения
+    legacy_amounts = [0.1, 0.2, 1.15, 0.29, 19.99, 1234.56, 350.0]
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO categories (id, name, user_id) VALUES (1, 'Еда', 7)")
+    conn.executemany(
+        "INSERT INTO expenses (category_id, user_id, amount, date) VALUES (1, 7, ?, '2024-05-01')",
+        [(amount,) for amount in legacy_amounts]
+    )
+    conn.execute("INSERT INTO limits (category_id, user_id, amount, month, year) VALUES (1, 7, 1500.5, 5, 2024)")
+    conn.commit()
+    conn.close()
+
+    # Повторный запуск не должен менять уже перенесенные суммы
+    init_db()
+    init_db()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT amount, typeof(amount) FROM expenses ORDER BY id").fetchall()
+        assert rows == [(amount, 'integer') for amount in [10, 20, 115, 29, 1999, 123456, 35000]]
+        assert conn.execute("SELECT SUM(amount) FROM expenses WHERE amount IN (10, 20)").fetchone() == (30,)
+        assert conn.execute("SELECT amount, typeof(amount) FROM limits").fetchall() == [(150050, 'integer')]
+        assert conn.execute("SELECT note FROM expenses").fetchall() == [(None,)] * len(legacy_amounts)
+    finally:
+        conn.close()
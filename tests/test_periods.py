@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+import pytz
+
+from main import Period, period_in_zone
+
+
+# UTC-метка для момента, заданного в UTC
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("zone, now, year, month, today", [
+    # Полночь 1 ноября 2015 в Гаване повторяется: сначала 00:00 по летнему времени
+    ("America/Havana", utc(2015, 11, 1, 3, 59, 59), 2015, 10, date(2015, 10, 31)),
+    ("America/Havana", utc(2015, 11, 1, 4), 2015, 11, date(2015, 11, 1)),
+    ("America/Havana", utc(2015, 11, 1, 5, 30), 2015, 11, date(2015, 11, 1)),
+    # Полночь 1 октября 2004 в Газе тоже повторяется
+    ("Asia/Gaza", utc(2004, 9, 30, 20, 59, 59), 2004, 9, date(2004, 9, 30)),
+    ("Asia/Gaza", utc(2004, 9, 30, 21), 2004, 10, date(2004, 10, 1)),
+    # А 1 апреля 2006 её нет: после 23:59:59 сразу 01:00
+    ("Asia/Gaza", utc(2006, 3, 31, 21, 59, 59), 2006, 3, date(2006, 3, 31)),
+    ("Asia/Gaza", utc(2006, 3, 31, 22), 2006, 4, date(2006, 4, 1)),
+    # Апиа пропустила 30 декабря 2011 целиком
+    ("Pacific/Apia", utc(2011, 12, 30, 9, 59, 59), 2011, 12, date(2011, 12, 29)),
+    ("Pacific/Apia", utc(2011, 12, 30, 10), 2011, 12, date(2011, 12, 31)),
+    ("Pacific/Apia", utc(2011, 12, 31, 10), 2012, 1, date(2012, 1, 1)),
+    # Во Владивостоке ноябрь наступает, пока в UTC еще 31 октября
+    ("Asia/Vladivostok", utc(2026, 10, 31, 13, 59, 59), 2026, 10, date(2026, 10, 31)),
+    ("Asia/Vladivostok", utc(2026, 10, 31, 14), 2026, 11, date(2026, 11, 1)),
+    # Переход через Новый год
+    ("Europe/Moscow", utc(2025, 12, 31, 20, 59, 59), 2025, 12, date(2025, 12, 31)),
+    ("Europe/Moscow", utc(2025, 12, 31, 21), 2026, 1, date(2026, 1, 1)),
+])
+def test_period_in_zone(zone, now, year, month, today):
+    period = period_in_zone(pytz.timezone(zone), now)
+    assert (period.year, period.month, period.today) == (year, month, today)
+    assert period.start <= today.isoformat() < period.end
+
+
+@pytest.mark.parametrize("zone", ["America/Havana", "Asia/Gaza", "Pacific/Apia", "Asia/Vladivostok"])
+def test_period_matches_local_date(zone):
+    tz = pytz.timezone(zone)
+    reference = ZoneInfo(zone)
+    moment = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    while moment.year < 2027:
+        local = moment.astimezone(reference).date()
+        period = period_in_zone(tz, moment.timestamp())
+        assert (period.year, period.month, period.today) == (local.year, local.month, local)
+        moment += timedelta(minutes=30)
+
+
+def test_period_bounds():
+    period = Period(2025, 12)
+    assert (period.start, period.end) == ("2025-12-01", "2026-01-01")
+    assert period.today is None
+
+
+def test_previous_crosses_year():
+    january = Period(2026, 1)
+    december = january.previous()
+    assert (december.year, december.month) == (2025, 12)
+    assert (december.start, december.end) == ("2025-12-01", january.start)
+    assert (Period(2026, 3).previous().start, Period(2026, 3).previous().end) == ("2026-02-01", "2026-03-01")
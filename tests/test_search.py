@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from main import EXPENSE_AMOUNT, SearchState, add_expense_finish, search_page, start_flow, write_db
+
+USER_ID = 7
+
+
+# Сообщение Telegram, которое запоминает ответы бота
+class Message:
+    def __init__(self, message_id, text=""):
+        self.message_id = message_id
+        self.text = text
+        self.from_user = SimpleNamespace(id=USER_ID)
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append(text)
+        return Message(self.message_id + len(self.replies), text)
+
+
+# Нажатие кнопки под сообщением
+class CallbackQuery:
+    def __init__(self, message, data):
+        self.message = message
+        self.data = data
+        self.from_user = message.from_user
+        self.answers = []
+        self.edits = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+    async def edit_message_text(self, text, reply_markup=None):
+        self.edits.append(text)
+
+
+@pytest.fixture
+def states(db, monkeypatch):
+    monkeypatch.setattr(main, "flow_states", {})
+    monkeypatch.setattr(main, "search_states", {})
+    with write_db() as cursor:
+        cursor.execute("INSERT INTO categories (id, name, user_id) VALUES (1, 'Аптека', ?)", (USER_ID,))
+
+
+def press(message, data):
+    query = CallbackQuery(message, data)
+    asyncio.run(search_page(SimpleNamespace(message=None, callback_query=query), None))
+    return query
+
+
+def test_stale_search_page_is_rejected(states):
+    state = SearchState("аптека")
+    state.message_id = 20
+    main.search_states[USER_ID] = state
+
+    query = press(Message(10), "search_10")
+    assert query.answers == ["Эти результаты устарели. Повторите поиск."]
+    assert query.edits == []
+
+    query = press(Message(20), "search_0")
+    assert query.answers == [None]
+    assert len(query.edits) == 1
+
+
+def add_expense(text):
+    start_flow(USER_ID, 'add_expense', 1, 'Аптека')
+    message = Message(1, text)
+    result = asyncio.run(add_expense_finish(SimpleNamespace(message=message, callback_query=None), None))
+    return result, message.replies
+
+
+@pytest.mark.parametrize("text, note", [
+    ("350 2 пачки аспирина", "2 пачки аспирина"),
+    ("350 2024 год", "2024 год"),
+    ("350", None),
+])
+def test_note_may_start_with_digit(states, text, note):
+    result, _ = add_expense(text)
+    assert result == main.ConversationHandler.END
+    with main.read_db() as cursor:
+        assert cursor.execute("SELECT amount, note FROM expenses").fetchall() == [(35000, note)]
+
+
+@pytest.mark.parametrize("text", ["1 000", "12 500 обед"])
+def test_thousands_separator_is_rejected(states, text):
+    result, replies = add_expense(text)
+    assert result == EXPENSE_AMOUNT
+    assert "без пробелов" in replies[0]